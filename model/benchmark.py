@@ -0,0 +1,321 @@
+"""
+Benchmark harness for solver2.py.
+
+Generates synthetic fleets, writes each one to a temporary SQLite database
+with the same schema as kochi-metro.db, and times every pipeline stage.
+Peak traced memory per stage comes from a second, traced run, since
+tracemalloc slows the Python stages several-fold. Results are written as JSON so runs can
+be compared against an earlier baseline:
+
+    python model/benchmark.py --sizes 1000,10000,50000 --output bench.json
+    python model/benchmark.py --sizes 1000,10000 --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import solver2
+
+# Same tables as src/database.js
+SCHEMA = """
+CREATE TABLE branding_slas (
+    sla_id TEXT PRIMARY KEY, trainset_id TEXT, target_exposure_hours INTEGER,
+    current_exposure_hours INTEGER, penalty_per_hour INTEGER
+);
+CREATE TABLE depot_layout_costs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, from_location TEXT, to_location TEXT, shunting_cost INTEGER
+);
+CREATE TABLE depot_resources (
+    resource_id TEXT PRIMARY KEY, available_capacity INTEGER
+);
+CREATE TABLE fitness_certificates (
+    certificate_id TEXT PRIMARY KEY, trainset_id TEXT, certificate_type TEXT, expiry_date TEXT
+);
+CREATE TABLE job_cards (
+    job_card_id TEXT PRIMARY KEY, trainset_id TEXT, status TEXT,
+    is_critical TEXT, description TEXT, required_man_hours INTEGER
+);
+CREATE TABLE trainsets (
+    trainset_id TEXT PRIMARY KEY, cumulative_mileage_km INTEGER, in_service_date TEXT, has_branding_wrap TEXT
+);
+"""
+
+# Per-trainset proportions of the shipped data/ set (100 trainsets)
+CERTIFICATE_TYPES = ["Rolling-Stock", "Signalling", "Telecom"]
+JOB_CARDS_PER_TRAIN = 0.78
+SLAS_PER_TRAIN = 0.45
+
+# Slower than this ratio against the baseline is reported as a regression;
+# stages faster than MIN_COMPARED_SECONDS in the baseline are too noisy to flag
+REGRESSION_RATIO = 1.2
+MIN_COMPARED_SECONDS = 0.05
+
+# Cold starts are the best of this many fresh solver2.py processes
+COLD_START_RUNS = 5
+SOLVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solver2.py")
+
+def _date_strings(start, offsets):
+    return [(start + datetime.timedelta(days=int(offset))).isoformat() for offset in offsets]
+
+def generate_fleet(db_path, n_trains, seed=0):
+    """
+    Writes a synthetic fleet of `n_trains` trainsets, with proportional
+    certificates, job cards and SLAs, to a new SQLite database.
+    Returns the row count of each table.
+    """
+    rng = np.random.default_rng(seed)
+    today = solver2.PLANNING_DATE
+    train_ids = [f"KMRL-T{i:05d}" for i in range(1, n_trains + 1)]
+
+    has_sla = rng.random(n_trains) < SLAS_PER_TRAIN
+    trainsets = list(zip(
+        train_ids,
+        rng.integers(100_000, 150_000, n_trains).tolist(),
+        _date_strings(datetime.date(2017, 1, 1), rng.integers(0, 730, n_trains)),
+        np.where(has_sla, "true", "false").tolist(),
+    ))
+
+    # Roughly 2% of certificates are already expired, a few more expire within a week
+    cert_trains = np.repeat(train_ids, len(CERTIFICATE_TYPES))
+    certificates = list(zip(
+        [f"CERT-{i:07d}" for i in range(len(cert_trains))],
+        cert_trains.tolist(),
+        CERTIFICATE_TYPES * n_trains,
+        _date_strings(today, rng.integers(-7, 365, len(cert_trains))),
+    ))
+
+    n_jobs = int(n_trains * JOB_CARDS_PER_TRAIN)
+    is_open = rng.random(n_jobs) < 0.49
+    is_critical = is_open & (rng.random(n_jobs) < 0.5)
+    job_cards = list(zip(
+        [f"MAXIMO-{i:07d}" for i in range(n_jobs)],
+        rng.choice(train_ids, n_jobs).tolist(),
+        np.where(is_open, "OPEN", "CLOSED").tolist(),
+        np.where(is_critical, "true", "false").tolist(),
+        np.where(is_critical, "Brake pad inspection", "Interior deep clean").tolist(),
+        rng.integers(2, 12, n_jobs).tolist(),
+    ))
+
+    sla_trains = np.array(train_ids)[has_sla]
+    targets = rng.integers(300, 500, len(sla_trains))
+    slas = list(zip(
+        [f"SLA-ADV-{i:06d}" for i in range(len(sla_trains))],
+        sla_trains.tolist(),
+        targets.tolist(),
+        (targets * rng.uniform(0.5, 1.05, len(sla_trains))).astype(int).tolist(),
+        rng.choice([50, 100, 150], len(sla_trains)).tolist(),
+    ))
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO trainsets VALUES (?,?,?,?)", trainsets)
+        conn.executemany("INSERT INTO fitness_certificates VALUES (?,?,?,?)", certificates)
+        conn.executemany("INSERT INTO job_cards VALUES (?,?,?,?,?,?)", job_cards)
+        conn.executemany("INSERT INTO branding_slas VALUES (?,?,?,?,?)", slas)
+        conn.executemany("INSERT INTO depot_resources VALUES (?,?)", [("IBL_Bays", 6), ("Cleaning_Staff_ManHours", 80)])
+        conn.executemany(
+            "INSERT INTO depot_layout_costs (from_location, to_location, shunting_cost) VALUES (?,?,?)",
+            [("Arrival_Track_1", "IBL_Bay_1", 10), ("Arrival_Track_1", "IBL_Bay_2", 15)],
+        )
+    conn.close()
+
+    return {
+        "trainsets": len(trainsets),
+        "certificates": len(certificates),
+        "job_cards": len(job_cards),
+        "slas": len(slas),
+    }
+
+def _timed(stages, name, memory, func, *args):
+    """
+    Runs one stage, recording its wall time and CPU time, or with `memory`
+    (tracemalloc running) its peak traced memory instead.
+    """
+    if memory:
+        tracemalloc.reset_peak()
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func(*args)
+    if memory:
+        stages[name] = {"peak_mb": round(tracemalloc.get_traced_memory()[1] / 2**20, 2)}
+    else:
+        stages[name] = {
+            "seconds": round(time.perf_counter() - wall, 4),
+            "cpu_seconds": round(time.process_time() - cpu, 4),
+        }
+    return result
+
+def run_pipeline(db_path, w_mileage, w_branding, solver_config, memory=False):
+    """
+    Times each solver2 stage on one database, or with `memory` traces each
+    stage's peak memory. Returns the per-stage records.
+    """
+    stages = {}
+    data = _timed(stages, "load_data_from_db", memory, solver2.load_data_from_db, db_path)
+    train_assessments = _timed(
+        stages, "assess_train_constraints", memory, solver2.assess_train_constraints, data, solver2.PLANNING_DATE
+    )
+    solution = _timed(
+        stages, "optimize_train_assignment", memory, solver2.optimize_train_assignment,
+        data, train_assessments, w_mileage, w_branding, solver_config
+    )
+    if "error" in solution:
+        raise RuntimeError(solution["error"])
+    _timed(
+        stages, "get_final_details", memory, solver2.get_final_details,
+        data, train_assessments, solution, w_mileage, w_branding
+    )
+    return stages
+
+def measure_memory(db_path, w_mileage, w_branding, solver_config):
+    """
+    Runs the pipeline again under tracemalloc. Returns {stage: peak MB}.
+    """
+    tracemalloc.start()
+    try:
+        stages = run_pipeline(db_path, w_mileage, w_branding, solver_config, memory=True)
+    finally:
+        tracemalloc.stop()
+    return {name: stage["peak_mb"] for name, stage in stages.items()}
+
+def _best_process_time(args, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SOLVER_SCRIPT, *args], capture_output=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 4)
+
+def measure_cold_start(db_path, w_mileage, w_branding, runs=COLD_START_RUNS):
+    """
+    Times fresh solver2.py processes, imports included: an argument error,
+    a full plan, and the same plan answered from the result cache.
+    """
+    weights = [str(w_mileage), str(w_branding)]
+    cache_path = db_path + ".bench-cache.db"
+    timings = {
+        "argument_error": _best_process_time([db_path, "x", "y"], runs),
+        "plan": _best_process_time([db_path, *weights, "--no-cache"], runs),
+    }
+    subprocess.run([sys.executable, SOLVER_SCRIPT, db_path, *weights, "--cache", cache_path], capture_output=True)
+    timings["cached_plan"] = _best_process_time([db_path, *weights, "--cache", cache_path], runs)
+    os.remove(cache_path)
+    return timings
+
+def compare(results, baseline):
+    """
+    Prints the per-stage time ratio against a baseline results file and
+    returns the number of regressions.
+    """
+    previous = {run["trainsets"]: run["stages"] for run in baseline["runs"]}
+    regressions = 0
+    for run in results["runs"]:
+        stages = previous.get(run["trainsets"])
+        if stages is None:
+            continue
+        for name, timing in run["stages"].items():
+            before = stages.get(name, {}).get("seconds")
+            if not before:
+                continue
+            ratio = timing["seconds"] / before
+            flag = ""
+            if ratio > REGRESSION_RATIO and before >= MIN_COMPARED_SECONDS:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(
+                f"{run['trainsets']:>7} {name:<28} {before:>9.3f}s -> {timing['seconds']:>9.3f}s  x{ratio:.2f}{flag}",
+                file=sys.stderr,
+            )
+    
+    for name, seconds in results.get("cold_start", {}).items():
+        before = baseline.get("cold_start", {}).get(name)
+        if not before:
+            continue
+        ratio = seconds / before
+        flag = ""
+        if ratio > REGRESSION_RATIO and before >= MIN_COMPARED_SECONDS:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{'cold':>7} {name:<28} {before:>9.3f}s -> {seconds:>9.3f}s  x{ratio:.2f}{flag}", file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark solver2.py on synthetic fleets.")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="comma-separated fleet sizes")
+    parser.add_argument("--w-mileage", type=int, default=7)
+    parser.add_argument("--w-branding", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--no-cold-start", dest="cold_start", action="store_false",
+                        help="skip timing fresh processes on the smallest fleet")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the traced run that measures peak memory per stage")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    solver_config = solver2.parse_solver_config({"workers": args.workers, "time_limit": args.time_limit})
+
+    results = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "runs": [],
+    }
+
+    # solver2 imports pandas and OR-Tools lazily; load them up front so the
+    # stage timings measure work, not imports (cold start covers those)
+    solver2.pd.DataFrame, solver2.cp_model.CpModel
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            db_path = os.path.join(tmp, f"fleet_{size}.db")
+            rows = generate_fleet(db_path, size, args.seed)
+            stages = run_pipeline(db_path, args.w_mileage, args.w_branding, solver_config)
+            total = round(sum(stage["seconds"] for stage in stages.values()), 4)
+            if args.memory:
+                peaks = measure_memory(db_path, args.w_mileage, args.w_branding, solver_config)
+                for name, peak_mb in peaks.items():
+                    stages[name]["peak_mb"] = peak_mb
+            results["runs"].append({"trainsets": size, "rows": rows, "stages": stages, "total_seconds": total})
+            print(f"{size:>7} trainsets: {total:.3f}s " + ", ".join(
+                f"{name}={stage['seconds']:.3f}s" + (f"/{stage['peak_mb']}MB" if "peak_mb" in stage else "")
+                for name, stage in stages.items()
+            ), file=sys.stderr)
+            if args.cold_start and size == min(sizes):
+                results["cold_start"] = measure_cold_start(db_path, args.w_mileage, args.w_branding)
+                print(f"{size:>7} trainsets cold start: " + ", ".join(
+                    f"{name}={seconds:.3f}s" for name, seconds in results["cold_start"].items()
+                ), file=sys.stderr)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Streaming bulk ingestion of Maximo and fleet CSV exports into kochi-metro.db.
+
+Each CSV is read in chunks and upserted with executemany, all inside one
+transaction, so a failed load leaves the database untouched. Rows are keyed
+on the table's primary key: new rows are inserted, changed rows updated and
+identical rows left alone, so a daily export can be loaded over the previous
+one and only real changes reach the change_log triggers (and the solver's
+incremental reload):
+
+    python model/ingest.py kochi-metro.db job_cards=exports/job_cards.csv
+    python model/ingest.py kochi-metro.db fitness_certificates=data/fitness_certificates.csv \\
+        job_cards=data/job_cards_maximo.csv --chunk-size 20000
+
+The database is switched to WAL mode and the trainset-keyed tables get an
+index on trainset_id, which the solver's partial reloads filter on.
+"""
+import argparse
+import csv
+import itertools
+import json
+import sqlite3
+import sys
+import time
+
+# Ingestible tables: primary key, columns and CREATE statement (as in src/database.js)
+INGEST_TABLES = {
+    "trainsets": (
+        "trainset_id",
+        ["trainset_id", "cumulative_mileage_km", "in_service_date", "has_branding_wrap"],
+        """CREATE TABLE IF NOT EXISTS trainsets (
+            trainset_id TEXT PRIMARY KEY, cumulative_mileage_km INTEGER, in_service_date TEXT, has_branding_wrap TEXT
+        )""",
+    ),
+    "fitness_certificates": (
+        "certificate_id",
+        ["certificate_id", "trainset_id", "certificate_type", "expiry_date"],
+        """CREATE TABLE IF NOT EXISTS fitness_certificates (
+            certificate_id TEXT PRIMARY KEY, trainset_id TEXT, certificate_type TEXT, expiry_date TEXT
+        )""",
+    ),
+    "job_cards": (
+        "job_card_id",
+        ["job_card_id", "trainset_id", "status", "is_critical", "description", "required_man_hours"],
+        """CREATE TABLE IF NOT EXISTS job_cards (
+            job_card_id TEXT PRIMARY KEY, trainset_id TEXT, status TEXT,
+            is_critical TEXT, description TEXT, required_man_hours INTEGER
+        )""",
+    ),
+    "branding_slas": (
+        "sla_id",
+        ["sla_id", "trainset_id", "target_exposure_hours", "current_exposure_hours", "penalty_per_hour"],
+        """CREATE TABLE IF NOT EXISTS branding_slas (
+            sla_id TEXT PRIMARY KEY, trainset_id TEXT, target_exposure_hours INTEGER,
+            current_exposure_hours INTEGER, penalty_per_hour INTEGER
+        )""",
+    ),
+    "depot_resources": (
+        "resource_id",
+        ["resource_id", "available_capacity"],
+        """CREATE TABLE IF NOT EXISTS depot_resources (
+            resource_id TEXT PRIMARY KEY, available_capacity INTEGER
+        )""",
+    ),
+}
+
+# Boolean-like columns are stored lowercased, as seed.js does. Empty fields
+# are stored as NULL, so INTEGER columns never hold ''
+LOWERCASED_COLUMNS = {"is_critical", "has_branding_wrap"}
+
+DEFAULT_CHUNK_SIZE = 10000
+
+def upsert_sql(table):
+    """
+    INSERT ... ON CONFLICT DO UPDATE for `table`. The update only fires when
+    a column actually differs, so re-loading an unchanged row is a no-op.
+    """
+    key, columns, _ = INGEST_TABLES[table]
+    values = [column for column in columns if column != key]
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT ({key}) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in values)} "
+        f"WHERE {' OR '.join(f'{c} IS NOT excluded.{c}' for c in values)}"
+    )
+
+def read_chunks(csv_path, table, chunk_size):
+    """
+    Yields lists of up to `chunk_size` parameter tuples, in the table's column
+    order, from the CSV at `csv_path`. Extra CSV columns are ignored.
+    """
+    _, columns, _ = INGEST_TABLES[table]
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [name.strip() for name in header]
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError(f"{csv_path} is missing columns for {table}: {', '.join(missing)}")
+
+        positions = [header.index(column) for column in columns]
+        lowercased = [i for i, column in enumerate(columns) if column in LOWERCASED_COLUMNS]
+        width = max(positions) + 1
+        while True:
+            chunk = []
+            for line in itertools.islice(reader, chunk_size):
+                if not line:
+                    continue
+                if len(line) < width:
+                    raise ValueError(f"{csv_path} line {reader.line_num}: expected {len(header)} fields, got {len(line)}")
+                row = [line[i] or None for i in positions]
+                for i in lowercased:
+                    if row[i] is not None:
+                        row[i] = row[i].lower()
+                chunk.append(row)
+            if not chunk:
+                return
+            yield chunk
+
+def ingest(db_path, sources, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Upserts each (table, csv path) in `sources` into the database in a single
+    transaction. Returns {table: {"rows": rows read, "changed": rows inserted
+    or updated}}. Raises on failure, after rolling back.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            summary = {}
+            for table, csv_path in sources:
+                conn.execute(INGEST_TABLES[table][2])
+                sql = upsert_sql(table)
+                counts = summary.setdefault(table, {"rows": 0, "changed": 0})
+                for chunk in read_chunks(csv_path, table, chunk_size):
+                    counts["rows"] += len(chunk)
+                    counts["changed"] += conn.executemany(sql, chunk).rowcount
+
+            # Indexed after loading, so a first bulk load doesn't maintain it row by row
+            for table in summary:
+                key, columns, _ = INGEST_TABLES[table]
+                if key != "trainset_id" and "trainset_id" in columns:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_trainset_id ON {table} (trainset_id)")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("PRAGMA optimize")
+        return summary
+    finally:
+        conn.close()
+
+def parse_sources(specs):
+    """
+    Parses TABLE=CSV arguments into (table, path) pairs.
+    """
+    sources = []
+    for spec in specs:
+        table, sep, csv_path = spec.partition("=")
+        if not sep or not csv_path:
+            raise ValueError(f"Expected TABLE=CSV, got '{spec}'")
+        if table not in INGEST_TABLES:
+            raise ValueError(f"Unknown table '{table}' (expected one of {', '.join(INGEST_TABLES)})")
+        sources.append((table, csv_path))
+    return sources
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load CSV exports into the planner database.")
+    parser.add_argument("db_path")
+    parser.add_argument("sources", nargs="+", metavar="TABLE=CSV")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        if args.chunk_size < 1:
+            raise ValueError("--chunk-size must be at least 1")
+        summary = ingest(args.db_path, parse_sources(args.sources), args.chunk_size)
+    except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+        print(json.dumps({"error": f"Ingestion failed: {e}"}))
+        sys.exit(1)
+
+    print(json.dumps({
+        "status": "Success",
+        "tables": summary,
+        "seconds": round(time.perf_counter() - start, 3),
+    }, indent=4))
+
+if __name__ == "__main__":
+    main()
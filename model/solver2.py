@@ -1,10 +1,43 @@
-import pandas as pd
-from ortools.sat.python import cp_model
+import argparse
+import contextlib
+import cProfile
+import functools
+import hashlib
+import importlib.util
+import re
+import time
+import tracemalloc
 import datetime
 import json
+import os
 import sys
 import sqlite3
-import numpy as np
+
+def _lazy_import(name):
+    """
+    Imports `name` on first attribute access (importlib.util.LazyLoader).
+    pandas, numpy and OR-Tools dominate start-up, and argument errors and
+    result cache hits need none of them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+pd = _lazy_import("pandas")
+np = _lazy_import("numpy")
+cp_model = _lazy_import("ortools.sat.python.cp_model")
+
+# Number of trains that must be inducted into revenue service each night
+REQUIRED_REVENUE = 16
+
+# Current date for certificate validation
+PLANNING_DATE = datetime.date(2025, 9, 18)
 
 # --- Configurable Metro Lines ---
 METRO_LINES = {
@@ -15,353 +48,944 @@ METRO_LINES = {
     "Line E (Long Express: 100km)": 1100,
 }
 
+# Average distance a revenue train covers per service day. Used to project
+# mileage over a planning horizon, where trains are not tied to one line.
+DAILY_REVENUE_KM = sum(METRO_LINES.values()) / len(METRO_LINES)
+
+# Branding exposure a wrapped train accrues per day in revenue service
+EXPOSURE_HOURS_PER_DAY = 16
+
+# Longest horizon (in nights) accepted by the horizon planner
+MAX_HORIZON_DAYS = 30
+
+# Depot stabling. IBL (inspection bay line) bays are named IBL_Bay_1..N from
+# the IBL_Bays count in depot_resources; trains arrive on ARRIVAL_LOCATION and
+# trains not given a bay are stabled on the stabling lines.
+ARRIVAL_LOCATION = "Arrival_Track_1"
+STABLING_LINE = "Stabling_Line"
+
+# Stabling score per man-hour of work done in a bay, traded off against
+# shunting cost. Trains held out by a critical job card count double.
+BAY_WORK_WEIGHT = 10
+
+# Frame name -> SQLite table. Frames are indexed by SQLite rowid so that
+# partially reloaded tables keep their on-disk row order.
+TABLES = {
+    "trainsets": "trainsets",
+    "certificates": "fitness_certificates",
+    "job_cards": "job_cards",
+    "slas": "branding_slas",
+    "resources": "depot_resources",
+    "layout_costs": "depot_layout_costs",
+}
+
+# Tables whose rows belong to a single trainset and can be reloaded per train
+TRAIN_KEYED_TABLES = {"trainsets", "certificates", "job_cards", "slas"}
+
+# Columns a what-if scenario may override, per frame
+SCENARIO_COLUMNS = {
+    "job_cards": {"status"},
+    "certificates": {"expiry_date"},
+    "trainsets": {"cumulative_mileage_km"},
+    "slas": {"current_exposure_hours", "target_exposure_hours"},
+}
+
+# Part of every result cache key. Bump it whenever a change to the code alters
+# plan, sweep or horizon output, so caches written by older code are not served.
+CACHE_VERSION = 4
+
+# Result cache limits; least recently used entries are evicted beyond either
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 64 * 2**20
+
+def _read_table(conn, table, train_ids=None):
+    """
+    Reads one table (optionally only the rows of `train_ids`) indexed by rowid.
+    """
+    sql = f"SELECT rowid AS _rowid, * from {table}"
+    params = None
+    if train_ids is not None:
+        params = list(train_ids)
+        sql += f" WHERE trainset_id IN ({','.join('?' * len(params))})"
+    return pd.read_sql_query(sql, conn, params=params, index_col="_rowid")
+
+def read_tables(db_path):
+    """
+    Reads all tables from the SQLite database into a dictionary of Pandas DataFrames.
+    Raises on failure; callers decide how to report it.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return {name: _read_table(conn, table) for name, table in TABLES.items()}
+    finally:
+        conn.close()
+
+class TableCache:
+    """
+    Keeps the tables loaded across planning runs and reloads only what changed.
+
+    Changes are detected with `PRAGMA data_version` on a persistent connection
+    and located with the `change_log` table that the Node server maintains via
+    triggers (one version counter per table and trainset). Without a change log
+    any database change reloads every table.
+    """
+    
+    # Above this many changed trainsets a table is cheaper to reload whole
+    MAX_PARTIAL_RELOAD = 500
+    
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.data = None
+        self._data_version = None
+        self._markers = None
+    
+    def invalidate(self):
+        self.data = None
+    
+    def _read_markers(self):
+        try:
+            rows = self.conn.execute("SELECT table_name, trainset_id, version FROM change_log").fetchall()
+        except sqlite3.OperationalError:
+            return None
+        return {(table, train_id): version for table, train_id, version in rows}
+    
+    def refresh(self):
+        """
+        Brings `self.data` up to date. Returns {frame name: changed trainset ids,
+        or None if the whole table was reloaded}; empty if nothing changed.
+        """
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if self.data is not None and data_version == self._data_version:
+            return {}
+        
+        # Markers are read before the rows, so a concurrent write is at worst
+        # picked up again on the next refresh.
+        markers = self._read_markers()
+        if self.data is None or markers is None or self._markers is None:
+            self.data = {name: _read_table(self.conn, table) for name, table in TABLES.items()}
+            changes = dict.fromkeys(TABLES)
+        else:
+            changed_ids = {}
+            for (table, train_id), version in markers.items():
+                if self._markers.get((table, train_id)) != version:
+                    changed_ids.setdefault(table, set()).add(train_id)
+            
+            changes = {}
+            for name, table in TABLES.items():
+                ids = changed_ids.get(table)
+                if not ids:
+                    continue
+                if name not in TRAIN_KEYED_TABLES or "" in ids or len(ids) > self.MAX_PARTIAL_RELOAD:
+                    self.data[name] = _read_table(self.conn, table)
+                    changes[name] = None
+                    continue
+                frame = self.data[name]
+                kept = frame[~frame["trainset_id"].isin(ids)]
+                fresh = _read_table(self.conn, table, ids)
+                self.data[name] = pd.concat([kept, fresh]).sort_index() if not fresh.empty else kept
+                changes[name] = ids
+        
+        self._data_version = data_version
+        self._markers = markers
+        return changes
+
 def load_data_from_db(db_path):
     """
     Loads all tables from the SQLite database into a dictionary of Pandas DataFrames.
     """
     try:
-        conn = sqlite3.connect(db_path)
-        data = {
-            "trainsets": pd.read_sql_query("SELECT * from trainsets", conn),
-            "certificates": pd.read_sql_query("SELECT * from fitness_certificates", conn),
-            "job_cards": pd.read_sql_query("SELECT * from job_cards", conn),
-            "slas": pd.read_sql_query("SELECT * from branding_slas", conn),
-            "resources": pd.read_sql_query("SELECT * from depot_resources", conn),
-            "layout_costs": pd.read_sql_query("SELECT * from depot_layout_costs", conn)
-        }
-        conn.close()
-        return data
+        return read_tables(db_path)
     except Exception as e:
         print(json.dumps({"error": f"Database loading failed: {e}"}))
         sys.exit(1)
 
-def assess_train_constraints(data, current_date):
+def data_digest(data):
+    """
+    Content hash of the loaded tables. Any added, removed or changed row
+    changes the digest.
+    """
+    digest = hashlib.sha256()
+    for name in TABLES:
+        frame = data[name]
+        digest.update(json.dumps([name, list(frame.columns)]).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def table_digest(db_path):
+    """
+    Content hash of every input table, computed by SQLite without loading
+    pandas, so a result cache hit can be answered before the data is read.
+    Each table is serialized in rowid order with quote() so values of
+    different types never collide.
+    """
+    digest = hashlib.sha256()
+    conn = sqlite3.connect(db_path)
+    try:
+        for table in TABLES.values():
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            if not columns:
+                raise sqlite3.OperationalError(f"no such table: {table}")
+            row = "||char(31)||".join(f"quote({column})" for column in columns)
+            (rows,) = conn.execute(
+                f"SELECT group_concat(row, char(30)) FROM (SELECT {row} AS row FROM {table} ORDER BY rowid)"
+            ).fetchone()
+            digest.update(json.dumps([table, columns]).encode())
+            digest.update((rows or "").encode())
+    finally:
+        conn.close()
+    return digest.hexdigest()
+
+def cache_key(digest, op, params):
+    """
+    Cache key for one request: the data digest plus everything that shapes
+    the output (op, weights, planning date, solver settings), the code's
+    CACHE_VERSION and the planning constants.
+    """
+    constants = [REQUIRED_REVENUE, METRO_LINES, BAY_WORK_WEIGHT]
+    payload = json.dumps([CACHE_VERSION, constants, digest, op, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def default_cache_path(db_path):
+    return os.path.splitext(db_path)[0] + ".cache.db"
+
+class ResultCache:
+    """
+    On-disk LRU cache of solver outputs, kept in its own SQLite file so the
+    planning database is never written to. Keys include the content hash
+    of the input tables, so a changed row simply misses; stale entries are
+    evicted least recently used first. Cache errors are treated as misses.
+    """
+    
+    def __init__(self, path, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.conn = None
+    
+    def _connect(self):
+        if self.conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL
+                )
+            """)
+            self.conn = conn
+        return self.conn
+    
+    def get(self, key):
+        """
+        Returns the cached output for `key`, or None.
+        """
+        try:
+            conn = self._connect()
+            with conn:
+                row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error:
+            return None
+        return json.loads(row[0])
+    
+    def put(self, key, output):
+        """
+        Stores an output and evicts entries beyond the count or size limit.
+        """
+        value = json.dumps(output)
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), time.time())
+                )
+                conn.execute("""
+                    DELETE FROM results WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key,
+                                   ROW_NUMBER() OVER (ORDER BY last_used DESC) AS position,
+                                   SUM(size) OVER (ORDER BY last_used DESC) AS total_size
+                            FROM results
+                        ) WHERE position > ? OR total_size > ?
+                    )
+                """, (self.max_entries, self.max_bytes))
+        except sqlite3.Error:
+            pass
+
+def _group_lists(frame, column):
+    """
+    Collects `column` into a tuple per trainset_id, preserving row order.
+    """
+    if frame.empty:
+        return pd.Series(dtype=object)
+    return frame.groupby("trainset_id", sort=False)[column].agg(lambda s: tuple(f"{v}" for v in s))
+
+class TrainAssessment:
+    """
+    Assessment of one train. A __slots__ record rather than a dict, since
+    large fleets and multi-day horizons hold many of them: status fields
+    are interned strings shared by every record and issue lists are tuples
+    (one shared empty tuple for most trains). Converted to JSON-ready dicts
+    only when reported, by get_final_details.
+    """
+    
+    __slots__ = (
+        "is_eligible", "cert_status", "cert_issues", "job_status", "critical_jobs", "pending_work_hours",
+        "branding_status", "branding_priority", "branding_urgency", "has_branding_wrap", "mileage",
+        "mileage_score", "age_days", "priority_score", "maintenance_demand", "next_cert_expiry",
+    )
+    
+    def __init__(self, is_eligible, cert_status, cert_issues, job_status, critical_jobs, pending_work_hours,
+                 branding_status, branding_priority, branding_urgency, has_branding_wrap, mileage,
+                 mileage_score, age_days, priority_score, maintenance_demand, next_cert_expiry):
+        self.is_eligible = is_eligible
+        self.cert_status = cert_status
+        self.cert_issues = cert_issues
+        self.job_status = job_status
+        self.critical_jobs = critical_jobs
+        self.pending_work_hours = pending_work_hours
+        self.branding_status = branding_status
+        self.branding_priority = branding_priority
+        self.branding_urgency = branding_urgency
+        self.has_branding_wrap = has_branding_wrap
+        self.mileage = mileage
+        self.mileage_score = mileage_score
+        self.age_days = age_days
+        self.priority_score = priority_score
+        self.maintenance_demand = maintenance_demand
+        self.next_cert_expiry = next_cert_expiry
+    
+    def __eq__(self, other):
+        if not isinstance(other, TrainAssessment):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+    
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"TrainAssessment({fields})"
+
+def assess_train_constraints(data, current_date, train_ids=None):
     """
     Enhanced comprehensive assessment of all 6 factors for each train.
+    All factors are computed for the whole fleet in one pass (groupby on
+    trainset_id) rather than re-filtering the child tables for every train.
+    If `train_ids` is given only those trains are assessed; mileage is still
+    normalized against the whole fleet. Returns {train_id: TrainAssessment}.
     """
     trainsets = data["trainsets"]
     certificates = data["certificates"]
-    job_cards = data["job_cards"].copy()
+    job_cards = data["job_cards"]
     slas = data["slas"]
-    resources = data["resources"]
+    
+    # Pre-calculate statistics for normalization
+    avg_mileage = np.mean(trainsets["cumulative_mileage_km"].to_numpy())
+    std_mileage = np.std(trainsets["cumulative_mileage_km"].to_numpy())
+    
+    if train_ids is not None:
+        trainsets = trainsets[trainsets["trainset_id"].isin(train_ids)]
+        certificates = certificates[certificates["trainset_id"].isin(train_ids)]
+        job_cards = job_cards[job_cards["trainset_id"].isin(train_ids)]
+        slas = slas[slas["trainset_id"].isin(train_ids)]
     
     # Data preprocessing
-    job_cards['is_critical'] = job_cards['is_critical'].astype(str).str.lower() == 'true'
-    certificates['expiry_date'] = pd.to_datetime(certificates['expiry_date']).dt.date
+    job_cards = job_cards.assign(is_critical=job_cards['is_critical'].astype(str).str.lower() == 'true')
+    expiry_ts = pd.to_datetime(certificates['expiry_date'])
     
-    # Get depot capacity
-    total_maintenance_capacity = resources['available_capacity'].sum() if not resources.empty else 100
+    train_ids = trainsets["trainset_id"]
+    n_trains = len(trainsets)
+    today = pd.Timestamp(current_date)
     
-    train_assessments = {}
+    # 1. FITNESS CERTIFICATES - Hard constraint
+    expired_mask = (expiry_ts < today).to_numpy()
+    soon_mask = ((expiry_ts >= today) & (expiry_ts <= today + pd.Timedelta(days=7))).to_numpy()
+    expired_issues = _group_lists(certificates[expired_mask], "certificate_type").reindex(train_ids)
+    soon_issues = _group_lists(certificates[soon_mask], "certificate_type").reindex(train_ids)
+    has_expired = expired_issues.notna().to_numpy()
+    has_soon = soon_issues.notna().to_numpy()
+    cert_status = np.select([has_expired, has_soon], ["EXPIRED", "EXPIRING_SOON"], default="VALID")
+    cert_issues = np.where(has_expired, expired_issues.to_numpy(), soon_issues.to_numpy())
+    next_cert_expiry = [
+        expiry.date() if pd.notna(expiry) else None
+        for expiry in expiry_ts.groupby(certificates["trainset_id"]).min().reindex(train_ids)
+    ]
     
-    # Pre-calculate statistics for normalization
-    all_mileages = trainsets["cumulative_mileage_km"].tolist()
-    avg_mileage = np.mean(all_mileages)
-    std_mileage = np.std(all_mileages)
-    
-    for _, train in trainsets.iterrows():
-        train_id = train["trainset_id"]
-        
-        # 1. FITNESS CERTIFICATES - Hard constraint
-        cert_status = "VALID"
-        cert_issues = []
-        train_certs = certificates[certificates["trainset_id"] == train_id]
-        
-        if not train_certs.empty:
-            expired_certs = train_certs[train_certs["expiry_date"] < current_date]
-            if not expired_certs.empty:
-                cert_status = "EXPIRED"
-                cert_issues = [f"{row['certificate_type']}" for _, row in expired_certs.iterrows()]
-            else:
-                # Check for soon-expiring certificates (within 7 days)
-                soon_expiring = train_certs[
-                    (train_certs["expiry_date"] >= current_date) &
-                    (train_certs["expiry_date"] <= current_date + datetime.timedelta(days=7))
-                ]
-                if not soon_expiring.empty:
-                    cert_status = "EXPIRING_SOON"
-                    cert_issues = [f"{row['certificate_type']}" for _, row in soon_expiring.iterrows()]
-        
-        # 2. JOB CARD STATUS - Hard constraint for critical jobs
-        job_status = "CLEAR"
-        pending_work_hours = 0
-        critical_jobs = []
-        
-        train_jobs = job_cards[job_cards["trainset_id"] == train_id]
-        if not train_jobs.empty:
-            open_jobs = train_jobs[train_jobs["status"] == "OPEN"]
-            pending_work_hours = open_jobs['required_man_hours'].sum()
-            
-            critical_open = open_jobs[open_jobs["is_critical"] == True]
-            if not critical_open.empty:
-                job_status = "CRITICAL_OPEN"
-                critical_jobs = critical_open['description'].tolist()
-            elif pending_work_hours > 0:
-                job_status = "MINOR_PENDING"
-        
-        # 3. BRANDING PRIORITIES - Business constraint
-        branding_priority = 0
-        branding_status = "NO_BRANDING"
-        branding_urgency = 0
-        
-        train_sla = slas[slas["trainset_id"] == train_id]
-        if not train_sla.empty:
-            sla_row = train_sla.iloc[0]
-            target_hours = sla_row["target_exposure_hours"]
-            current_hours = sla_row["current_exposure_hours"]
-            penalty = sla_row["penalty_per_hour"]
-            
-            if current_hours < target_hours:
-                shortfall = target_hours - current_hours
-                branding_priority = shortfall * penalty
-                completion_ratio = current_hours / target_hours
-                
-                if completion_ratio < 0.7:  # Less than 70% complete
-                    branding_status = "URGENT_BRANDING"
-                    branding_urgency = 100
-                elif completion_ratio < 0.9:  # Less than 90% complete
-                    branding_status = "MODERATE_BRANDING"
-                    branding_urgency = 70
-                else:
-                    branding_status = "NEAR_COMPLETE"
-                    branding_urgency = 30
-            else:
-                branding_status = "BRANDING_COMPLETE"
-                branding_urgency = 0
-        
-        # Check if train has branding wrap capability
-        has_branding_wrap = str(train.get("has_branding_wrap", "false")).lower() == 'true'
-        
-        # 4. MILEAGE BALANCING - Optimization factor
-        mileage = train["cumulative_mileage_km"]
-        
-        # Calculate mileage score (lower mileage = higher score)
-        # Using z-score for better normalization
-        if std_mileage > 0:
-            mileage_z = (mileage - avg_mileage) / std_mileage
-            # Convert to 0-100 scale (lower mileage gets higher score)
-            mileage_score = max(0, 100 - (mileage_z * 20 + 50))
-        else:
-            mileage_score = 50
-        
-        # 5. MAINTENANCE DEMAND - Resource constraint
-        maintenance_demand = pending_work_hours
-        
-        # 6. AGE FACTOR - Consider in-service date for wear and tear
-        in_service_date = pd.to_datetime(train["in_service_date"]).date()
-        days_in_service = (current_date - in_service_date).days
-        age_factor = min(100, days_in_service / 365 * 10)  # Normalize age
-        
-        # ELIGIBILITY DETERMINATION
-        is_eligible = (cert_status == "VALID" or cert_status == "EXPIRING_SOON") and job_status != "CRITICAL_OPEN"
-        
-        # COMPREHENSIVE PRIORITY SCORING for eligible trains
-        priority_score = 0
-        if is_eligible:
-            # Base score components
-            base_score = mileage_score  # Start with mileage balancing
-            
-            # Branding boost (only if has branding capability)
-            if has_branding_wrap:
-                base_score += branding_urgency
-            
-            # Maintenance penalty (higher pending work = lower priority)
-            maintenance_penalty = min(30, pending_work_hours * 2)
-            base_score -= maintenance_penalty
-            
-            # Age consideration (older trains slightly prioritized for rest)
-            age_adjustment = -min(10, age_factor / 10)
-            base_score += age_adjustment
-            
-            priority_score = max(1, base_score)  # Ensure positive score
-        
-        train_assessments[train_id] = {
-            "is_eligible": is_eligible,
-            "cert_status": cert_status,
-            "cert_issues": cert_issues,
-            "job_status": job_status,
-            "critical_jobs": critical_jobs,
-            "pending_work_hours": pending_work_hours,
-            "branding_status": branding_status,
-            "branding_priority": branding_priority,
-            "branding_urgency": branding_urgency,
-            "has_branding_wrap": has_branding_wrap,
-            "mileage": mileage,
-            "mileage_score": mileage_score,
-            "age_days": days_in_service,
-            "priority_score": priority_score,
-            "maintenance_demand": maintenance_demand
-        }
+    # 2. JOB CARD STATUS - Hard constraint for critical jobs
+    open_jobs = job_cards[job_cards["status"] == "OPEN"]
+    # Blank man-hours count as none; the sums stay integral for CP-SAT
+    pending_work_hours = (
+        open_jobs.groupby("trainset_id", sort=False)["required_man_hours"].sum()
+        .reindex(train_ids, fill_value=0).round().astype(np.int64).to_numpy()
+    )
+    critical_jobs = _group_lists(open_jobs[open_jobs["is_critical"]], "description").reindex(train_ids)
+    has_critical = critical_jobs.notna().to_numpy()
+    job_status = np.select([has_critical, pending_work_hours > 0], ["CRITICAL_OPEN", "MINOR_PENDING"], default="CLEAR")
+    
+    # 3. BRANDING PRIORITIES - Business constraint
+    sla_rows = slas.drop_duplicates("trainset_id", keep="first").set_index("trainset_id").reindex(train_ids)
+    has_sla = train_ids.isin(slas["trainset_id"]).to_numpy()
+    target_hours = sla_rows["target_exposure_hours"].to_numpy(dtype=float)
+    current_hours = sla_rows["current_exposure_hours"].to_numpy(dtype=float)
+    penalty = sla_rows["penalty_per_hour"].to_numpy(dtype=float)
+    
+    in_progress = has_sla & (current_hours < target_hours)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        completion_ratio = current_hours / target_hours
+    branding_priority = np.where(in_progress, (target_hours - current_hours) * penalty, 0)
+    branding_status = np.select(
+        [~has_sla, ~in_progress, completion_ratio < 0.7, completion_ratio < 0.9],
+        ["NO_BRANDING", "BRANDING_COMPLETE", "URGENT_BRANDING", "MODERATE_BRANDING"],
+        default="NEAR_COMPLETE",
+    )
+    branding_urgency = np.select(
+        [~in_progress, completion_ratio < 0.7, completion_ratio < 0.9], [0, 100, 70], default=30
+    )
+    
+    # Check if train has branding wrap capability
+    if "has_branding_wrap" in trainsets:
+        has_branding_wrap = (trainsets["has_branding_wrap"].astype(str).str.lower() == 'true').to_numpy()
+    else:
+        has_branding_wrap = np.zeros(n_trains, dtype=bool)
+    
+    # 4. MILEAGE BALANCING - Optimization factor
+    mileage = trainsets["cumulative_mileage_km"].to_numpy()
+    
+    # Calculate mileage score (lower mileage = higher score)
+    # Using z-score for better normalization
+    if std_mileage > 0:
+        mileage_z = (mileage - avg_mileage) / std_mileage
+        # Convert to 0-100 scale (lower mileage gets higher score)
+        mileage_score = np.maximum(0, 100 - (mileage_z * 20 + 50))
+    else:
+        mileage_score = np.full(n_trains, 50)
+    
+    # 5. MAINTENANCE DEMAND - Resource constraint
+    maintenance_demand = pending_work_hours
+    
+    # 6. AGE FACTOR - Consider in-service date for wear and tear
+    in_service_date = pd.to_datetime(trainsets["in_service_date"]).dt.normalize()
+    days_in_service = (today - in_service_date).dt.days.to_numpy()
+    age_factor = np.minimum(100, days_in_service / 365 * 10)  # Normalize age
+    
+    # ELIGIBILITY DETERMINATION
+    is_eligible = (cert_status != "EXPIRED") & ~has_critical
+    
+    # COMPREHENSIVE PRIORITY SCORING for eligible trains
+    # Mileage balancing, plus branding boost (only if has branding capability),
+    # minus maintenance penalty, plus age adjustment (older trains rest more)
+    base_score = mileage_score + np.where(has_branding_wrap, branding_urgency, 0)
+    base_score = base_score - np.minimum(30, pending_work_hours * 2)
+    base_score = base_score + -np.minimum(10, age_factor / 10)
+    
+    columns = zip(
+        train_ids.tolist(), is_eligible.tolist(), cert_status.tolist(), cert_issues.tolist(),
+        job_status.tolist(), critical_jobs.tolist(), pending_work_hours.tolist(),
+        branding_status.tolist(), branding_priority.tolist(), branding_urgency.tolist(),
+        has_branding_wrap.tolist(), mileage.tolist(), mileage_score.tolist(),
+        days_in_service.tolist(), base_score.tolist(), maintenance_demand.tolist(), next_cert_expiry,
+    )
+    train_assessments = {}
+    for (train_id, eligible, cert, issues, job, critical, pending, b_status, b_priority,
+         b_urgency, wrap, km, km_score, age_days, base, demand, next_expiry) in columns:
+        train_assessments[train_id] = TrainAssessment(
+            eligible,
+            sys.intern(cert),
+            issues if isinstance(issues, tuple) else (),
+            sys.intern(job),
+            critical if isinstance(critical, tuple) else (),
+            pending,
+            sys.intern(b_status),
+            b_priority,
+            b_urgency,
+            wrap,
+            km,
+            km_score,
+            age_days,
+            max(1, base) if eligible else 0,  # Ensure positive score
+            demand,
+            next_expiry
+        )
     
     return train_assessments
 
-def optimize_train_assignment(data, train_assessments, w_mileage, w_branding):
+def revenue_score(assessment, w_mileage, w_branding):
     """
-    Enhanced multi-objective optimization using OR-Tools with proper weight application.
+    Objective contribution of a train if it is assigned to Revenue Service.
     """
-    # Constants
-    REQUIRED_REVENUE = 16
-    MAX_STANDBY = 20  # Maximum trains that can be on standby
+    # Calculate composite score using user weights directly
+    mileage_component = int(assessment.mileage_score * w_mileage)
+    branding_component = 0
+    if assessment.has_branding_wrap:
+        branding_component = int(assessment.branding_urgency * w_branding)
     
-    # Separate eligible and ineligible trains
-    eligible_trains = [tid for tid, assessment in train_assessments.items() if assessment["is_eligible"]]
-    ineligible_trains = [tid for tid, assessment in train_assessments.items() if not assessment["is_eligible"]]
+    return mileage_component + branding_component
+
+def revenue_scores(assessments, w_mileage, w_branding):
+    """
+    revenue_score for a sequence of assessments, as an int64 array.
+    """
+    n = len(assessments)
+    mileage_score = np.fromiter((a.mileage_score for a in assessments), dtype=float, count=n)
+    branding_urgency = np.fromiter((a.branding_urgency for a in assessments), dtype=float, count=n)
+    has_wrap = np.fromiter((a.has_branding_wrap for a in assessments), dtype=bool, count=n)
+    mileage_component = np.trunc(mileage_score * w_mileage).astype(np.int64)
+    branding_component = np.where(has_wrap, np.trunc(branding_urgency * w_branding), 0).astype(np.int64)
+    return mileage_component + branding_component
+
+def _top_k(values, k):
+    """
+    Indices of the k largest values, ties going to the lowest index. O(n).
+    """
+    if k >= len(values):
+        return np.arange(len(values))
+    threshold = np.partition(values, len(values) - k)[len(values) - k]
+    above = np.flatnonzero(values > threshold)
+    ties = np.flatnonzero(values == threshold)[:k - len(above)]
+    return np.concatenate([above, ties])
+
+def _eligibility_error(eligible):
+    if eligible < REQUIRED_REVENUE:
+        return f"Insufficient eligible trains: {eligible} available, {REQUIRED_REVENUE} required"
+    return None
+
+# CP-SAT settings; overridable per run from CLI flags or a request's "solver" object
+DEFAULT_SOLVER_CONFIG = {
+    "workers": 0,            # 0 = one worker per core
+    "time_limit": 10.0,      # seconds
+    "relative_gap": 0.0,     # stop once within this fraction of the bound
+    "deterministic": False,  # reproducible parallel search
+    "fast_first": False,     # start from a greedy plan and report each improvement
+    "instant": False,        # skip CP-SAT and return the greedy plan
+}
+
+# Share of the time limit given to each follow-on solve (stabling, lines)
+FOLLOW_ON_TIME_SHARE = 0.1
+
+def parse_solver_config(options):
+    """
+    Validates solver options over DEFAULT_SOLVER_CONFIG. Raises ValueError.
+    """
+    options = options or {}
+    unknown = set(options) - set(DEFAULT_SOLVER_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown solver options: {', '.join(sorted(unknown))}")
+    config = {**DEFAULT_SOLVER_CONFIG, **options}
+    config["workers"] = int(config["workers"])
+    config["time_limit"] = float(config["time_limit"])
+    config["relative_gap"] = float(config["relative_gap"])
+    config["deterministic"] = bool(config["deterministic"])
+    config["fast_first"] = bool(config["fast_first"])
+    config["instant"] = bool(config["instant"])
+    if config["workers"] < 0 or config["time_limit"] <= 0 or config["relative_gap"] < 0:
+        raise ValueError("workers and relative_gap must be non-negative and time_limit positive")
+    return config
+
+def make_solver(solver_config=None, follow_on=False):
+    """
+    Creates a CpSolver with the given (parsed) solver configuration applied.
+    `follow_on` solvers (the small stabling and line models solved after
+    the revenue assignment) get FOLLOW_ON_TIME_SHARE of the time limit and
+    one worker, so a whole plan stays close to the requested budget.
+    """
+    config = solver_config or DEFAULT_SOLVER_CONFIG
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = config["time_limit"] * (FOLLOW_ON_TIME_SHARE if follow_on else 1)
+    if follow_on:
+        solver.parameters.num_workers = 1
+    elif config["workers"]:
+        solver.parameters.num_workers = config["workers"]
+    if config["relative_gap"]:
+        solver.parameters.relative_gap_limit = config["relative_gap"]
+    if config["deterministic"]:
+        # Same plan for the same input regardless of machine load
+        solver.parameters.interleave_search = True
+        solver.parameters.random_seed = 0
+    return solver
+
+@functools.lru_cache(maxsize=None)
+def _solution_progress_class():
+    # Defined on first use, so importing this module does not load OR-Tools
+    class SolutionProgress(cp_model.CpSolverSolutionCallback):
+        """
+        Reports every improving solution found during search to `on_solution`.
+        `decode` turns the callback's current values into a solution dict.
+        """
+        
+        def __init__(self, on_solution, decode):
+            super().__init__()
+            self.on_solution = on_solution
+            self.decode = decode
+        
+        def on_solution_callback(self):
+            self.on_solution({
+                "objective": int(self.ObjectiveValue()),
+                "bound": int(self.BestObjectiveBound()),
+                "wall_time": round(self.WallTime(), 3),
+                "solution": self.decode(self)
+            })
     
-    if len(eligible_trains) < REQUIRED_REVENUE:
-        return {
-            "error": f"Insufficient eligible trains: {len(eligible_trains)} available, {REQUIRED_REVENUE} required"
-        }
+    return SolutionProgress
+
+def solution_progress(on_solution, decode):
+    """
+    CP-SAT solution callback that reports each improving solution.
+    """
+    return _solution_progress_class()(on_solution, decode)
+
+class Profiler:
+    """
+    Instrumentation for one run: wall time and CPU time per pipeline stage,
+    plus CP-SAT search statistics for every solve. With `memory`, stages
+    record peak traced memory instead of times: tracemalloc slows Python
+    code several-fold, so timings and memory peaks come from separate runs.
+    Reported as the "profile" entry of the output's metrics block.
+    """
     
-    # Create the OR-Tools model
-    model = cp_model.CpModel()
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = {}
+        self.cp_sat = []
+        self._log = []
+        # Load the lazily imported libraries up front, so stages time work rather than imports
+        pd.DataFrame, np.ndarray, cp_model.CpModel
+        self._started_tracing = memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
     
-    # Create decision variables
-    train_vars = {}
-    for train_id in eligible_trains:
-        # 0 = Revenue Service, 1 = Standby, 2 = Maintenance
-        train_vars[train_id] = model.NewIntVar(0, 2, f'train_{train_id}')
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block. Repeated stages (e.g. sweep solves) accumulate.
+        """
+        if self.memory:
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            if self.memory:
+                record = self.stages.setdefault(name, {"peak_mb": 0.0, "calls": 0})
+                record["peak_mb"] = max(record["peak_mb"], round(tracemalloc.get_traced_memory()[1] / 2**20, 2))
+            else:
+                record = self.stages.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0, "calls": 0})
+                record["seconds"] = round(record["seconds"] + time.perf_counter() - wall, 4)
+                record["cpu_seconds"] = round(record["cpu_seconds"] + time.process_time() - cpu, 4)
+            record["calls"] += 1
     
-    # CONSTRAINT 1: Exactly REQUIRED_REVENUE trains in revenue service
-    revenue_vars = []
-    for train_id in eligible_trains:
-        is_revenue = model.NewBoolVar(f'is_revenue_{train_id}')
-        model.Add(train_vars[train_id] == 0).OnlyEnforceIf(is_revenue)
-        model.Add(train_vars[train_id] != 0).OnlyEnforceIf(is_revenue.Not())
-        revenue_vars.append(is_revenue)
+    def attach(self, solver):
+        """
+        Captures the search log of `solver`, which is the only place CP-SAT
+        reports when presolve ends.
+        """
+        self._log = []
+        solver.parameters.log_search_progress = True
+        solver.parameters.log_to_stdout = False
+        solver.log_callback = self._log.append
     
-    model.Add(sum(revenue_vars) == REQUIRED_REVENUE)
+    def record_solver(self, solver, status, model):
+        """
+        Appends the statistics of `solver`'s last solve, labelled `model`.
+        """
+        objective = solver.ObjectiveValue()
+        bound = solver.BestObjectiveBound()
+        search_start = next(
+            (match for match in (re.match(r"Starting search at ([\d.]+)s", line) for line in self._log) if match), None
+        )
+        self.cp_sat.append({
+            "model": model,
+            "status": solver.StatusName(status),
+            "objective": objective,
+            "bound": bound,
+            "gap": round(abs(bound - objective) / max(1.0, abs(objective)), 6),
+            "branches": solver.NumBranches(),
+            "conflicts": solver.NumConflicts(),
+            "presolve_seconds": float(search_start.group(1)) if search_start else None,
+            "wall_time": round(solver.WallTime(), 4),
+            "user_time": round(solver.UserTime(), 4)
+        })
+        self._log = []
     
-    # CONSTRAINT 2: Trains with high maintenance demand should go to maintenance
-    for train_id in eligible_trains:
-        assessment = train_assessments[train_id]
-        if assessment["pending_work_hours"] > 15:
-            model.Add(train_vars[train_id] == 2)  # Force to maintenance
+    def close(self):
+        """
+        Stops memory tracing if this profiler started it, so later unprofiled
+        runs pay no overhead. Safe to call more than once.
+        """
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracing = False
     
-    # OBJECTIVE: Maximize weighted score
-    objective_terms = []
+    def report(self):
+        """
+        Returns the recorded statistics and closes the profiler.
+        """
+        self.close()
+        return {"stages": self.stages, "cp_sat": self.cp_sat}
+
+def profile_stage(profiler, name):
+    """
+    `profiler.stage(name)`, or a no-op when profiling is off.
+    """
+    return profiler.stage(name) if profiler is not None else contextlib.nullcontext()
+
+class AssignmentModel:
+    """
+    CP-SAT assignment model built once per assessment. Only the objective
+    changes between weight pairs, so one model can be re-solved many times,
+    each solve hinted with the previous solution.
+    """
     
-    for train_id in eligible_trains:
-        assessment = train_assessments[train_id]
+    def __init__(self, train_assessments):
+        self.train_assessments = train_assessments
+        self.last_solution = None
         
-        # Calculate composite score using user weights directly
-        mileage_component = int(assessment["mileage_score"] * w_mileage)
-        branding_component = 0
-        if assessment["has_branding_wrap"]:
-            branding_component = int(assessment["branding_urgency"] * w_branding)
+        # Separate eligible and ineligible trains
+        eligible_trains = [tid for tid, assessment in train_assessments.items() if assessment.is_eligible]
+        self.ineligible_trains = [tid for tid, assessment in train_assessments.items() if not assessment.is_eligible]
         
-        composite_score = mileage_component + branding_component
+        self.error = _eligibility_error(len(eligible_trains))
+        if self.error:
+            return
         
-        # Apply bonus only if assigned to revenue service
-        is_revenue = model.NewBoolVar(f'obj_revenue_{train_id}')
-        model.Add(train_vars[train_id] == 0).OnlyEnforceIf(is_revenue)
-        model.Add(train_vars[train_id] != 0).OnlyEnforceIf(is_revenue.Not())
+        # CONSTRAINT 2: Trains with high maintenance demand go to maintenance.
+        # They are fixed up front and get no decision variable.
+        self.maintenance_trains = [tid for tid in eligible_trains if train_assessments[tid].pending_work_hours > 15]
+        self.candidate_trains = [tid for tid in eligible_trains if train_assessments[tid].pending_work_hours <= 15]
         
-        revenue_bonus = model.NewIntVar(0, 100000, f'revenue_bonus_{train_id}')
-        model.Add(revenue_bonus == composite_score).OnlyEnforceIf(is_revenue)
-        model.Add(revenue_bonus == 0).OnlyEnforceIf(is_revenue.Not())
+        # Create the OR-Tools model
+        self.model = cp_model.CpModel()
         
-        objective_terms.append(revenue_bonus)
-    
-    # Set objective
-    model.Maximize(sum(objective_terms))
-    
-    # Solve
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 10.0  # Reasonable time limit
-    status = solver.Solve(model)
+        # One boolean per candidate: True = Revenue Service, False = Standby.
+        # Maintenance earns nothing in the objective, so it is not offered to
+        # trains that are not forced there.
+        self.revenue_vars = [self.model.NewBoolVar(f'revenue_{train_id}') for train_id in self.candidate_trains]
+        
+        # CONSTRAINT 1: Exactly REQUIRED_REVENUE trains in revenue service
+        self.model.Add(sum(self.revenue_vars) == REQUIRED_REVENUE)
     
-    # Process solution
-    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+    def _solution(self, boolean_value):
         solution = {}
         
         # Assign ineligible trains to maintenance
-        for train_id in ineligible_trains:
+        for train_id in self.ineligible_trains:
+            solution[train_id] = "Maintenance"
+        
+        for train_id in self.maintenance_trains:
             solution[train_id] = "Maintenance"
         
         # Assign eligible trains based on OR-Tools solution
-        for train_id in eligible_trains:
-            assignment_value = solver.Value(train_vars[train_id])
-            if assignment_value == 0:
-                solution[train_id] = "Revenue Service"
-            elif assignment_value == 1:
-                solution[train_id] = "Standby"
-            else:
-                solution[train_id] = "Maintenance"
+        for train_id, is_revenue in zip(self.candidate_trains, self.revenue_vars):
+            solution[train_id] = "Revenue Service" if boolean_value(is_revenue) else "Standby"
         
         return solution
-    else:
-        # Fallback to original optimization if OR-Tools fails
-        return optimize_train_assignment_fallback(train_assessments, w_mileage, w_branding)
+    
+    def solve(self, w_mileage, w_branding, solver_config=None, on_solution=None, profiler=None):
+        """
+        Solves for one weight pair. Returns the solution dict, or None if
+        CP-SAT finds no feasible assignment. `on_solution` is called with
+        every improving solution found during search.
+        """
+        # OBJECTIVE: Maximize weighted score of the trains in revenue service
+        scores = [revenue_score(self.train_assessments[tid], w_mileage, w_branding) for tid in self.candidate_trains]
+        self.model.Maximize(cp_model.LinearExpr.WeightedSum(self.revenue_vars, scores))
+        
+        # Warm start from the previous solve, or from the greedy top-k plan
+        self.model.ClearHints()
+        if self.last_solution is not None:
+            for train_id, is_revenue in zip(self.candidate_trains, self.revenue_vars):
+                self.model.AddHint(is_revenue, self.last_solution[train_id] == "Revenue Service")
+        elif solver_config and solver_config["fast_first"]:
+            greedy = greedy_assignment(self.train_assessments, w_mileage, w_branding)
+            for train_id, is_revenue in zip(self.candidate_trains, self.revenue_vars):
+                self.model.AddHint(is_revenue, greedy[train_id] == "Revenue Service")
+        
+        # Solve
+        solver = make_solver(solver_config)
+        callback = None
+        if on_solution is not None:
+            callback = solution_progress(on_solution, lambda cb: self._solution(cb.BooleanValue))
+        if profiler is not None:
+            profiler.attach(solver)
+        with profile_stage(profiler, "search"):
+            status = solver.Solve(self.model, callback)
+        if profiler is not None:
+            profiler.record_solver(solver, status, "assignment")
+        
+        # Process solution
+        if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+            return None
+        
+        solution = self._solution(solver.BooleanValue)
+        self.last_solution = solution
+        return solution
 
-def optimize_train_assignment_fallback(train_assessments, w_mileage, w_branding):
+def optimize_train_assignment(data, train_assessments, w_mileage, w_branding, solver_config=None, on_solution=None,
+                              profiler=None, hint=None):
     """
-    Fallback optimization method if OR-Tools fails.
+    Enhanced multi-objective optimization using OR-Tools with proper weight application.
+    `hint` is an earlier solution to warm-start the search from. With
+    `instant` set in the solver config CP-SAT is skipped for the greedy plan.
     """
-    REQUIRED_REVENUE = 16
+    if solver_config and solver_config["instant"]:
+        error = _eligibility_error(sum(1 for assessment in train_assessments.values() if assessment.is_eligible))
+        if error:
+            return {"error": error}
+        with profile_stage(profiler, "search"):
+            return greedy_assignment(train_assessments, w_mileage, w_branding)
     
-    # Separate eligible and ineligible trains
-    eligible_trains = [tid for tid, assessment in train_assessments.items() if assessment["is_eligible"]]
-    ineligible_trains = [tid for tid, assessment in train_assessments.items() if not assessment["is_eligible"]]
+    with profile_stage(profiler, "model_build"):
+        assignment_model = AssignmentModel(train_assessments)
+    if assignment_model.error:
+        return {"error": assignment_model.error}
+    assignment_model.last_solution = hint
     
-    # Enhanced weighted scoring with user preferences
-    weighted_scores = []
+    solution = assignment_model.solve(w_mileage, w_branding, solver_config, on_solution, profiler)
+    if solution is None:
+        # Fall back to the greedy plan if OR-Tools fails
+        return greedy_assignment(train_assessments, w_mileage, w_branding)
+    return solution
+
+def parse_weight_grid(spec):
+    """
+    Parses a weight grid: a comma-separated list ("1,5,10") or an inclusive
+    range ("start:stop:step"). Raises ValueError on malformed input.
+    """
+    if ":" in spec:
+        start, stop, step = (int(part) for part in spec.split(":"))
+        if step <= 0:
+            raise ValueError("step must be positive")
+        return list(range(start, stop + 1, step))
+    return [int(part) for part in spec.split(",")]
+
+def weight_grid(w_mileage_values, w_branding_values):
+    """
+    Cartesian product of two weight grids, each a list of integers or a
+    grid spec accepted by parse_weight_grid.
+    """
+    def values(spec):
+        if isinstance(spec, str):
+            return parse_weight_grid(spec)
+        return [int(value) for value in spec]
     
-    for tid in eligible_trains:
-        assessment = train_assessments[tid]
-        
-        # Apply user weights to core factors
-        mileage_component = assessment["mileage_score"] * (w_mileage / 10.0)
-        
-        branding_component = 0
-        if assessment["has_branding_wrap"]:
-            branding_component = assessment["branding_urgency"] * (w_branding / 100.0)
-        
-        # Combined score with normalized weights
-        total_weight = max(1, (w_mileage / 10.0) + (w_branding / 100.0))
-        weighted_score = (mileage_component + branding_component) / total_weight
-        
-        # Add small random factor to break ties
-        tie_breaker = np.random.uniform(0.001, 0.01)
+    return [(w_m, w_b) for w_m in values(w_mileage_values) for w_b in values(w_branding_values)]
+
+def sweep_weights(train_assessments, weight_pairs, solver_config=None, profiler=None):
+    """
+    Solves every (w_mileage, w_branding) pair against one shared model and
+    returns the distinct plans and the Pareto front of mileage balance
+    (sum of mileage scores in revenue) vs branding coverage (sum of
+    branding urgency of wrapped trains in revenue).
+    """
+    with profile_stage(profiler, "model_build"):
+        assignment_model = AssignmentModel(train_assessments)
+    if assignment_model.error:
+        return {"error": assignment_model.error}
+    
+    plans = []
+    plan_index = {}
+    runs = []
+    for w_mileage, w_branding in weight_pairs:
+        solution = assignment_model.solve(w_mileage, w_branding, solver_config, profiler=profiler)
+        if solution is None:
+            solution = greedy_assignment(train_assessments, w_mileage, w_branding)
         
-        weighted_scores.append((tid, weighted_score + tie_breaker, assessment["mileage_score"], assessment["branding_urgency"]))
+        revenue = sorted(tid for tid, status in solution.items() if status == "Revenue Service")
+        key = tuple(revenue)
+        if key not in plan_index:
+            plan_index[key] = len(plans)
+            assessments = [train_assessments[tid] for tid in revenue]
+            plans.append({
+                "revenue_trains": revenue,
+                "mileage_balance": round(sum(a.mileage_score for a in assessments), 2),
+                "branding_coverage": sum(a.branding_urgency for a in assessments if a.has_branding_wrap),
+                "avg_mileage_revenue": round(np.mean([a.mileage for a in assessments])),
+                "weights": []
+            })
+        plans[plan_index[key]]["weights"].append([w_mileage, w_branding])
+        runs.append({"w_mileage": w_mileage, "w_branding": w_branding, "plan": plan_index[key]})
     
-    # Sort by weighted score (highest first)
-    weighted_scores.sort(key=lambda x: x[1], reverse=True)
+    # A plan is on the front unless another is at least as good on both axes
+    # and strictly better on one
+    pareto_front = [
+        i for i, plan in enumerate(plans)
+        if not any(
+            other["mileage_balance"] >= plan["mileage_balance"]
+            and other["branding_coverage"] >= plan["branding_coverage"]
+            and (other["mileage_balance"], other["branding_coverage"]) != (plan["mileage_balance"], plan["branding_coverage"])
+            for other in plans
+        )
+    ]
     
-    # Enhanced assignment logic
-    solution = {}
+    output = {
+        "status": "Success",
+        "runs": runs,
+        "plans": plans,
+        "pareto_front": pareto_front
+    }
+    if profiler is not None:
+        output["metrics"] = {"profile": profiler.report()}
+    return output
+
+def greedy_assignment(train_assessments, w_mileage, w_branding):
+    """
+    Deterministic plan under the CP-SAT model's rules and objective:
+    ineligible trains and trains with more than 15 pending hours go to
+    Maintenance, the REQUIRED_REVENUE candidates with the best
+    revenue_score to Revenue Service (ties to the train listed first) and
+    the rest to Standby. If there are too few candidates, the best
+    high-maintenance eligible trains make up the number.
+    The model's only coupling constraint is the revenue count, so this
+    top-k is optimal whenever CP-SAT has a feasible model. Vectorized; used
+    as the instant plan, the fallback and the fast_first hint.
+    """
+    train_ids = list(train_assessments)
+    assessments = list(train_assessments.values())
+    eligible = np.fromiter((a.is_eligible for a in assessments), dtype=bool, count=len(assessments))
+    pending = np.fromiter((a.pending_work_hours for a in assessments), dtype=float, count=len(assessments))
+    scores = revenue_scores(assessments, w_mileage, w_branding)
     
-    # Assign ineligible trains to maintenance
-    for tid in ineligible_trains:
-        solution[tid] = "Maintenance"
+    candidates = np.flatnonzero(eligible & (pending <= 15))
+    revenue = candidates[_top_k(scores[candidates], REQUIRED_REVENUE)]
+    if len(revenue) < REQUIRED_REVENUE:
+        reserves = np.flatnonzero(eligible & (pending > 15))
+        revenue = np.concatenate([revenue, reserves[_top_k(scores[reserves], REQUIRED_REVENUE - len(revenue))]])
     
-    # Assign top eligible trains to revenue service
-    revenue_assigned = 0
-    for tid, score, mileage_score, branding_urgency in weighted_scores:
-        if revenue_assigned < REQUIRED_REVENUE:
-            solution[tid] = "Revenue Service"
-            revenue_assigned += 1
-        else:
-            # For remaining trains, decide between Standby and Maintenance
-            assessment = train_assessments[tid]
-            
-            # Trains with high maintenance demand go to maintenance
-            if assessment["pending_work_hours"] > 10 or assessment["cert_status"] == "EXPIRING_SOON":
-                solution[tid] = "Maintenance"
-            else:
-                solution[tid] = "Standby"
+    statuses = np.where(eligible & (pending <= 15), "Standby", "Maintenance").astype(object)
+    statuses[revenue] = "Revenue Service"
+    return dict(zip(train_ids, statuses.tolist()))
+
+def plan_quality(train_assessments, solution, w_mileage, w_branding):
+    """
+    Objective of `solution` under the CP-SAT objective, the LP upper bound
+    (the best REQUIRED_REVENUE candidate scores; the cardinality constraint
+    makes the LP relaxation integral) and the relative gap between them.
+    The bound is None when the model has too few candidates to be feasible.
+    """
+    assessments = list(train_assessments.values())
+    scores = revenue_scores(assessments, w_mileage, w_branding)
+    in_revenue = np.fromiter(
+        (solution[tid] == "Revenue Service" for tid in train_assessments), dtype=bool, count=len(assessments)
+    )
+    objective = int(scores[in_revenue].sum())
     
-    return solution
+    candidates = np.fromiter(
+        (a.is_eligible and a.pending_work_hours <= 15 for a in assessments), dtype=bool, count=len(assessments)
+    )
+    if candidates.sum() < REQUIRED_REVENUE:
+        return {"objective": objective, "bound": None, "gap": None}
+    candidate_scores = scores[candidates]
+    bound = int(candidate_scores[_top_k(candidate_scores, REQUIRED_REVENUE)].sum())
+    gap = (bound - objective) / abs(bound) if bound else 0.0
+    return {"objective": objective, "bound": bound, "gap": round(gap, 6)}
 
 def generate_assignment_reasoning(train_id, assessment, assigned_status, w_mileage, w_branding):
     """
     Enhanced context-aware reasoning for assignments.
     """
-    if not assessment["is_eligible"]:
+    if not assessment.is_eligible:
         reasons = []
-        if assessment["cert_status"] == "EXPIRED":
-            reasons.extend([f"Expired {cert}" for cert in assessment["cert_issues"]])
-        if assessment["job_status"] == "CRITICAL_OPEN":
+        if assessment.cert_status == "EXPIRED":
+            reasons.extend([f"Expired {cert}" for cert in assessment.cert_issues])
+        if assessment.job_status == "CRITICAL_OPEN":
             reasons.append("Critical Open Job Card")
         return ", ".join(reasons)
     
@@ -371,42 +995,42 @@ def generate_assignment_reasoning(train_id, assessment, assigned_status, w_milea
     
     # Primary assignment factors
     if assigned_status == "Revenue Service":
-        if assessment["branding_urgency"] > 70 and w_branding > 50:
+        if assessment.branding_urgency > 70 and w_branding > 50:
             primary_factors.append("High Branding Priority")
-        elif assessment["mileage_score"] > 70 and w_mileage > 5:
+        elif assessment.mileage_score > 70 and w_mileage > 5:
             primary_factors.append("Optimal Mileage")
         else:
             primary_factors.append("Balanced Readiness")
     
     elif assigned_status == "Standby":
-        if assessment["pending_work_hours"] > 5:
+        if assessment.pending_work_hours > 5:
             primary_factors.append("Maintenance Buffer")
-        elif assessment["mileage_score"] < 40:
+        elif assessment.mileage_score < 40:
             primary_factors.append("High Mileage Rotation")
         else:
             primary_factors.append("Operational Reserve")
     
     elif assigned_status == "Maintenance":
-        if assessment["pending_work_hours"] > 10:
+        if assessment.pending_work_hours > 10:
             primary_factors.append("Substantial Maintenance Needed")
-        elif assessment["cert_status"] == "EXPIRING_SOON":
+        elif assessment.cert_status == "EXPIRING_SOON":
             primary_factors.append("Certification Renewal")
         else:
             primary_factors.append("Scheduled Maintenance")
     
     # Secondary context factors
-    if assessment["has_branding_wrap"]:
-        if assessment["branding_status"] == "URGENT_BRANDING":
+    if assessment.has_branding_wrap:
+        if assessment.branding_status == "URGENT_BRANDING":
             secondary_factors.append("Branding Urgent")
-        elif assessment["branding_status"] == "MODERATE_BRANDING":
+        elif assessment.branding_status == "MODERATE_BRANDING":
             secondary_factors.append("Branding Due")
     
-    if assessment["job_status"] == "MINOR_PENDING":
-        secondary_factors.append(f"Minor Work: {assessment['pending_work_hours']}h")
+    if assessment.job_status == "MINOR_PENDING":
+        secondary_factors.append(f"Minor Work: {assessment.pending_work_hours}h")
     
-    if assessment["mileage_score"] > 80:
+    if assessment.mileage_score > 80:
         secondary_factors.append("Low Mileage")
-    elif assessment["mileage_score"] < 30:
+    elif assessment.mileage_score < 30:
         secondary_factors.append("High Mileage")
     
     # Combine reasoning
@@ -416,43 +1040,42 @@ def generate_assignment_reasoning(train_id, assessment, assigned_status, w_milea
     
     return reasoning
 
-def get_final_details(data, train_assessments, solution, w_mileage, w_branding):
+def get_final_details(data, train_assessments, solution, w_mileage, w_branding, stabling=None, lines=None):
     """
     Generate final output with enhanced details and reasoning.
+    Per-train fields come from the assessment record, so this is linear
+    in fleet size. `stabling` maps train IDs to their overnight location
+    and `lines` revenue trains to their metro line.
     """
-    train_df = data["trainsets"]
-    avg_mileage = train_df['cumulative_mileage_km'].mean()
+    avg_mileage = data["trainsets"]['cumulative_mileage_km'].mean()
     
     all_trains_details = []
     
     for train_id, assigned_status in solution.items():
-        train_data = train_df[train_df["trainset_id"] == train_id].iloc[0]
         assessment = train_assessments[train_id]
         
         # Generate enhanced reasoning
         reasoning = generate_assignment_reasoning(train_id, assessment, assigned_status, w_mileage, w_branding)
         
-        # Get next certificate expiry
-        certificates = data["certificates"]
-        train_certs = certificates[certificates['trainset_id'] == train_id]
-        if not train_certs.empty:
-            next_cert_expiry = train_certs['expiry_date'].min()
-        else:
-            next_cert_expiry = pd.NaT
+        next_cert_expiry = assessment.next_cert_expiry
         
         # Enhanced details
         details = {
             "Train ID": train_id,
             "Assigned Status": assigned_status,
-            "Is Eligible": assessment["is_eligible"],
+            "Is Eligible": assessment.is_eligible,
             "Eligibility Reason": reasoning,
-            "Cumulative Mileage": int(assessment["mileage"]),
-            "Mileage vs Avg (%)": round((assessment["mileage"] / avg_mileage) * 100),
-            "Pending Work Hours": int(assessment["pending_work_hours"]),
-            "Branding Priority": int(assessment["branding_priority"]),
-            "Next Cert Expiry": next_cert_expiry.strftime('%Y-%m-%d') if pd.notna(next_cert_expiry) else "N/A",
-            "Priority Score": round(assessment["priority_score"], 2)
+            "Cumulative Mileage": int(assessment.mileage),
+            "Mileage vs Avg (%)": round((assessment.mileage / avg_mileage) * 100),
+            "Pending Work Hours": int(assessment.pending_work_hours),
+            "Branding Priority": int(assessment.branding_priority),
+            "Next Cert Expiry": next_cert_expiry.strftime('%Y-%m-%d') if next_cert_expiry else "N/A",
+            "Priority Score": round(assessment.priority_score, 2)
         }
+        if stabling is not None:
+            details["Stabling Location"] = stabling[train_id]
+        if lines is not None:
+            details["Assigned Line"] = lines.get(train_id)
         all_trains_details.append(details)
     
     # Sort by status and then by Train ID
@@ -461,38 +1084,272 @@ def get_final_details(data, train_assessments, solution, w_mileage, w_branding):
     
     return all_trains_details
 
-def main():
+def depot_config(data):
     """
-    Main execution function with enhanced 6-factor optimization.
+    Reads the stabling resources: IBL bay names, the maintenance man-hours
+    available overnight and the shunting costs as a sparse
+    {(from_location, to_location): cost} dict.
     """
-    if len(sys.argv) < 4:
-        print(json.dumps({"error": "Usage: python solver2.py <db_path> <w_mileage> <w_branding>"}))
-        sys.exit(1)
+    resources = data["resources"]
+    capacity = dict(zip(resources["resource_id"], resources["available_capacity"]))
+    layout = data["layout_costs"]
+    shunting_costs = {
+        (from_location, to_location): int(cost)
+        for from_location, to_location, cost in zip(
+            layout["from_location"], layout["to_location"], layout["shunting_cost"]
+        )
+    }
+    return {
+        "bays": [f"IBL_Bay_{i}" for i in range(1, int(capacity.get("IBL_Bays", 0)) + 1)],
+        "man_hours": int(capacity.get("Cleaning_Staff_ManHours", 0)),
+        "shunting_costs": shunting_costs,
+    }
+
+def shunting_cost(shunting_costs, to_location, from_location=ARRIVAL_LOCATION):
+    """
+    Cost of one move. Moves missing from the layout table are charged as
+    the most expensive listed move.
+    """
+    cost = shunting_costs.get((from_location, to_location))
+    if cost is None:
+        cost = max(shunting_costs.values(), default=0)
+    return cost
+
+def plan_stabling(train_assessments, solution, depot, solver_config=None, previous=None, profiler=None):
+    """
+    Assigns Maintenance trains to concrete IBL bays. At most one train per
+    bay and the bays' work must fit in the available man-hours; the model
+    maximises the work done overnight less the shunting cost of moving
+    each train from arrival into its bay.
+    Which train goes in which bay does not change the objective, so the
+    model only picks the trains and how many bays to fill, cheapest first;
+    the chosen trains then take the bays in train order. With `previous`
+    (an earlier {train_id: location}), ties are broken towards keeping
+    trains in the bays they had. In `instant` mode, or when CP-SAT finds
+    no solution in time, trains are picked greedily, most valuable work
+    per man-hour first.
+    Returns ({train_id: location}, stabling metrics).
+    """
+    stabling = {train_id: STABLING_LINE for train_id in solution}
+    metrics = {"ibl_bays_used": 0, "bay_man_hours": 0, "shunting_cost": 0}
     
-    db_path = sys.argv[1]
-    try:
-        w_mileage = int(sys.argv[2])
-        w_branding = int(sys.argv[3])
-    except ValueError:
-        print(json.dumps({"error": "Weights for mileage and branding must be integers."}))
-        sys.exit(1)
+    waiting = [
+        tid for tid, status in solution.items()
+        if status == "Maintenance" and 0 < train_assessments[tid].pending_work_hours <= depot["man_hours"]
+    ]
+    if not depot["bays"] or not waiting:
+        return stabling, metrics
     
-    # Current date for certificate validation
-    current_date = datetime.date(2025, 9, 18)
+    # Stable sort: bays of equal cost stay in numbering order
+    bays = sorted(depot["bays"], key=lambda bay: shunting_cost(depot["shunting_costs"], bay))
+    bay_costs = [shunting_cost(depot["shunting_costs"], bay) for bay in bays]
+    hours = [train_assessments[tid].pending_work_hours for tid in waiting]
+    values = [
+        h * BAY_WORK_WEIGHT * (2 if train_assessments[tid].job_status == "CRITICAL_OPEN" else 1)
+        for tid, h in zip(waiting, hours)
+    ]
     
-    # Load and analyze data
-    data = load_data_from_db(db_path)
-    train_assessments = assess_train_constraints(data, current_date)
+    greedy = _greedy_bay_choice(hours, values, bay_costs, depot["man_hours"])
+    if solver_config and solver_config["instant"]:
+        chosen = [(waiting[i], hours[i]) for i in greedy]
+        return _fill_bays(chosen, bays, bay_costs, previous, stabling, metrics)
     
+    model = cp_model.CpModel()
+    train_vars = [model.NewBoolVar(f'bay_{train_id}') for train_id in waiting]
+    bay_vars = [model.NewBoolVar(f'used_{bay}') for bay in bays]
+    model.Add(sum(train_vars) == sum(bay_vars))
+    for cheaper, dearer in zip(bay_vars, bay_vars[1:]):
+        model.AddImplication(dearer, cheaper)
+    model.Add(cp_model.LinearExpr.WeightedSum(train_vars, hours) <= depot["man_hours"])
+    objective = cp_model.LinearExpr.WeightedSum(train_vars, values) - cp_model.LinearExpr.WeightedSum(bay_vars, bay_costs)
+    if previous:
+        # Lexicographic: any objective gain outweighs keeping every previous train
+        kept = [var for tid, var in zip(waiting, train_vars) if previous.get(tid, STABLING_LINE) != STABLING_LINE]
+        objective = objective * (len(kept) + 1) + sum(kept)
+    model.Maximize(objective)
+    
+    # The greedy pick is always feasible: hint it, and keep it if CP-SAT
+    # finds nothing better within its share of the time limit
+    picked = set(greedy)
+    for i, var in enumerate(train_vars):
+        model.AddHint(var, i in picked)
+    for i, var in enumerate(bay_vars):
+        model.AddHint(var, i < len(greedy))
+    
+    solver = make_solver(solver_config, follow_on=True)
+    if profiler is not None:
+        profiler.attach(solver)
+    status = solver.Solve(model)
+    if profiler is not None:
+        profiler.record_solver(solver, status, "stabling")
+    if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+        chosen = [(waiting[i], hours[i]) for i in greedy]
+    else:
+        chosen = [(tid, h) for tid, h, var in zip(waiting, hours, train_vars) if solver.BooleanValue(var)]
+    return _fill_bays(chosen, bays, bay_costs, previous, stabling, metrics)
+
+def _greedy_bay_choice(hours, values, bay_costs, man_hours):
+    """
+    Picks trains for the bays greedily, most valuable work per man-hour
+    first, while the work outweighs the next bay's shunting cost and fits
+    in `man_hours`. Returns the picked indices in ascending order.
+    """
+    chosen = []
+    used_hours = 0
+    # Stable sort: critical work (worth double) first, then the longest jobs
+    for i in sorted(range(len(hours)), key=lambda i: (-values[i] / hours[i], -hours[i])):
+        if len(chosen) == len(bay_costs):
+            break
+        if values[i] > bay_costs[len(chosen)] and used_hours + hours[i] <= man_hours:
+            chosen.append(i)
+            used_hours += hours[i]
+    return sorted(chosen)
+
+def _fill_bays(chosen, bays, bay_costs, previous, stabling, metrics):
+    """
+    Puts the chosen (train_id, hours) into the cheapest bays and updates
+    `stabling` and `metrics`. Returns both.
+    """
+    used_bays = dict(zip(bays[:len(chosen)], bay_costs))
+    
+    # Trains keep their previous bay if it is still in use; the rest fill
+    # the remaining bays in order
+    previous = previous or {}
+    kept = {tid: previous.get(tid) for tid, _ in chosen if previous.get(tid) in used_bays}
+    free_bays = iter(bay for bay in used_bays if bay not in kept.values())
+    for train_id, h in chosen:
+        bay = kept.get(train_id) or next(free_bays)
+        stabling[train_id] = bay
+        metrics["ibl_bays_used"] += 1
+        metrics["bay_man_hours"] += int(h)
+        metrics["shunting_cost"] += used_bays[bay]
+    return stabling, metrics
+
+def assign_lines(train_assessments, solution, solver_config=None, profiler=None):
+    """
+    Assigns each revenue train to one of METRO_LINES so that the variance
+    of fleet mileage after tonight's service is as small as possible
+    (low-mileage trains take the long lines). Every line is served: the
+    revenue trains are split across the lines as evenly as possible.
+    Variance is n * sum(m^2) - (sum m)^2 over the whole fleet. Each train's
+    squared mileage is linear in its line booleans, so only the fleet
+    total needs a product constraint; mileage is centred on the fleet mean
+    to keep the scaled integers small. In `instant` mode, or when CP-SAT
+    finds no solution in time, the trains are dealt out by mileage
+    instead, lowest mileage to the longest line.
+    Returns ({train_id: line}, line metrics).
+    """
+    mileage = {tid: int(assessment.mileage) for tid, assessment in train_assessments.items()}
+    metrics = {"mileage_std_current": round(np.std(list(mileage.values())))}
+    revenue = [tid for tid, status in solution.items() if status == "Revenue Service"]
+    if not revenue:
+        return {}, metrics
+    
+    n = len(mileage)
+    mean = round(sum(mileage.values()) / n)
+    centred_total = sum(mileage.values()) - mean * n
+    lines = list(METRO_LINES)
+    line_km = list(METRO_LINES.values())
+    
+    dealt = _deal_lines(revenue, mileage)
+    if solver_config and solver_config["instant"]:
+        return _line_metrics(dealt, mileage, metrics)
+    
+    model = cp_model.CpModel()
+    line_vars = {(tid, line): model.NewBoolVar(f'line_{tid}_{line}') for tid in revenue for line in lines}
+    for train_id in revenue:
+        model.AddExactlyOne(line_vars[train_id, line] for line in lines)
+    fewest, most = len(revenue) // len(lines), -(-len(revenue) // len(lines))
+    for line in lines:
+        model.AddLinearConstraint(sum(line_vars[tid, line] for tid in revenue), fewest, most)
+    
+    # Fleet mileage total after tonight, centred, and its square
+    variables = [line_vars[tid, line] for tid in revenue for line in lines]
+    low = centred_total + len(revenue) * min(line_km)
+    high = centred_total + len(revenue) * max(line_km)
+    total = model.NewIntVar(low, high, 'total')
+    model.Add(total == centred_total + cp_model.LinearExpr.WeightedSum(variables, line_km * len(revenue)))
+    total_squared = model.NewIntVar(0, max(low * low, high * high), 'total_squared')
+    model.AddMultiplicationEquality(total_squared, [total, total])
+    
+    squares = [2 * (mileage[tid] - mean) * km + km * km for tid in revenue for km in line_km]
+    model.Minimize(n * cp_model.LinearExpr.WeightedSum(variables, squares) - total_squared)
+    
+    # Dealing by mileage is always feasible: hint it, and keep it if CP-SAT
+    # finds nothing within its share of the time limit
+    for (tid, line), var in line_vars.items():
+        model.AddHint(var, dealt[tid] == line)
+    
+    solver = make_solver(solver_config, follow_on=True)
+    if profiler is not None:
+        profiler.attach(solver)
+    status = solver.Solve(model)
+    if profiler is not None:
+        profiler.record_solver(solver, status, "lines")
+    if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+        return _line_metrics(dealt, mileage, metrics)
+    
+    assignment = {
+        tid: line for (tid, line), var in line_vars.items() if solver.BooleanValue(var)
+    }
+    return _line_metrics(assignment, mileage, metrics)
+
+def _deal_lines(revenue, mileage):
+    """
+    Deals the revenue trains out by mileage, lowest mileage to the longest
+    line, as evenly as possible across METRO_LINES. Returns {train_id: line}.
+    """
+    # Longest lines first; the first len(revenue) % len(lines) of them take one extra train
+    lines = sorted(METRO_LINES, key=lambda line: -METRO_LINES[line])
+    extra = len(revenue) % len(lines)
+    trains = iter(sorted(revenue, key=lambda tid: mileage[tid]))
+    assignment = {}
+    for i, line in enumerate(lines):
+        for _ in range(len(revenue) // len(lines) + (i < extra)):
+            assignment[next(trains)] = line
+    return assignment
+
+def _line_metrics(assignment, mileage, metrics):
+    """
+    Adds the projected mileage spread of a line assignment to `metrics`.
+    Returns (assignment, metrics).
+    """
+    for train_id, line in assignment.items():
+        mileage[train_id] += METRO_LINES[line]
+    metrics["mileage_std_projected"] = round(np.std(list(mileage.values())))
+    return assignment, metrics
+
+def build_plan(data, train_assessments, w_mileage, w_branding, solver_config=None, on_solution=None, profiler=None,
+               hint=None, previous_stabling=None):
+    """
+    Optimizes one weight pair and assembles the JSON-ready output.
+    `hint` and `previous_stabling` (an earlier plan's statuses and stabling
+    locations) warm-start the solve and keep the bays stable.
+    Returns {"error": ...} if no plan can be produced.
+    """
     # Optimize assignments
-    solution = optimize_train_assignment(data, train_assessments, w_mileage, w_branding)
+    solution = optimize_train_assignment(
+        data, train_assessments, w_mileage, w_branding, solver_config, on_solution, profiler, hint
+    )
     
     if "error" in solution:
-        print(json.dumps(solution))
-        sys.exit(1)
+        return solution
+    
+    # Put Maintenance trains into IBL bays
+    with profile_stage(profiler, "stabling"):
+        stabling, stabling_metrics = plan_stabling(
+            train_assessments, solution, depot_config(data), solver_config, previous_stabling, profiler
+        )
+    
+    # Spread revenue trains over the lines to balance fleet mileage
+    with profile_stage(profiler, "lines"):
+        lines, line_metrics = assign_lines(train_assessments, solution, solver_config, profiler)
     
     # Generate final output
-    all_trains_details = get_final_details(data, train_assessments, solution, w_mileage, w_branding)
+    with profile_stage(profiler, "details"):
+        all_trains_details = get_final_details(
+            data, train_assessments, solution, w_mileage, w_branding, stabling, lines
+        )
     
     # Enhanced metrics
     revenue_trains = [s for s in solution.values() if s == 'Revenue Service']
@@ -503,19 +1360,1012 @@ def main():
         "revenue_trains": len(revenue_trains),
         "maintenance_trains": len(maintenance_trains),
         "standby_trains": len(standby_trains),
-        "avg_mileage_revenue": round(np.mean([train_assessments[tid]["mileage"] for tid in solution if solution[tid] == "Revenue Service"])),
-        "avg_mileage_standby": round(np.mean([train_assessments[tid]["mileage"] for tid in solution if solution[tid] == "Standby"])),
-        "branding_coverage": len([tid for tid in solution if solution[tid] == "Revenue Service" and train_assessments[tid]["has_branding_wrap"]]),
+        "avg_mileage_revenue": round(np.mean([train_assessments[tid].mileage for tid in solution if solution[tid] == "Revenue Service"])),
+        "avg_mileage_standby": round(np.mean([train_assessments[tid].mileage for tid in solution if solution[tid] == "Standby"])),
+        "branding_coverage": len([tid for tid in solution if solution[tid] == "Revenue Service" and train_assessments[tid].has_branding_wrap]),
+        **plan_quality(train_assessments, solution, w_mileage, w_branding),
+        **stabling_metrics,
+        **line_metrics,
         "status": "Success"
     }
+    if profiler is not None:
+        metrics["profile"] = profiler.report()
     
-    output = {
+    return {
         "status": "Success",
         "assignments": all_trains_details,
         "metrics": metrics
     }
+
+def apply_overrides(data, overrides):
+    """
+    Applies what-if overrides to a copy of the tables. Each override is
+    {"table": frame name, "where": {column: value}, "set": {column: value}},
+    e.g. {"table": "job_cards", "where": {"job_card_id": "MAXIMO-..."}, "set": {"status": "CLOSED"}}.
+    Only SCENARIO_COLUMNS can be set. Returns the scenario tables and
+    {frame name: trainset ids touched}. Raises ValueError on a bad override.
+    """
+    scenario = dict(data)
+    changes = {}
+    for override in overrides:
+        if not isinstance(override, dict):
+            raise ValueError("each override must be an object")
+        table = override.get("table")
+        if table not in SCENARIO_COLUMNS:
+            raise ValueError(f"table must be one of {sorted(SCENARIO_COLUMNS)}")
+        where = override.get("where") or {}
+        updates = override.get("set") or {}
+        if not isinstance(where, dict) or not isinstance(updates, dict):
+            raise ValueError("'where' and 'set' must be objects")
+        if not where or not updates:
+            raise ValueError("each override needs 'where' and 'set'")
+        
+        frame = scenario[table]
+        unknown = set(where) - set(frame.columns)
+        if unknown:
+            raise ValueError(f"unknown {table} columns: {sorted(unknown)}")
+        not_allowed = set(updates) - SCENARIO_COLUMNS[table]
+        if not_allowed:
+            raise ValueError(f"{table} overrides may only set {sorted(SCENARIO_COLUMNS[table])}")
+        for column, value in updates.items():
+            if pd.api.types.is_integer_dtype(frame[column]):
+                if not isinstance(value, int) or isinstance(value, bool):
+                    raise ValueError(f"{column} must be an integer")
+            elif pd.api.types.is_numeric_dtype(frame[column]):
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    raise ValueError(f"{column} must be a number")
+            elif not isinstance(value, str):
+                raise ValueError(f"{column} must be a string")
+            if column == "expiry_date":
+                datetime.date.fromisoformat(value)
+        
+        mask = np.ones(len(frame), dtype=bool)
+        for column, value in where.items():
+            mask &= (frame[column] == value).to_numpy()
+        if not mask.any():
+            raise ValueError(f"no {table} rows match {where}")
+        
+        # Copy each frame once, on first write; untouched frames are shared
+        if frame is data[table]:
+            frame = frame.copy()
+        for column, value in updates.items():
+            frame.loc[mask, column] = value
+        scenario[table] = frame
+        changes.setdefault(table, set()).update(frame.loc[mask, "trainset_id"])
+    return scenario, changes
+
+def assess_scenario(data, train_assessments, overrides, current_date):
+    """
+    Applies overrides and re-assesses only the trains they touch, except
+    mileage overrides, which change the fleet normalization for every
+    train. Returns the scenario tables and assessments.
+    """
+    scenario_data, changes = apply_overrides(data, overrides)
+    if "trainsets" in changes:
+        return scenario_data, assess_train_constraints(scenario_data, current_date)
+    scenario_assessments = {
+        **train_assessments,
+        **assess_train_constraints(scenario_data, current_date, train_ids=set().union(*changes.values()))
+    }
+    return scenario_data, scenario_assessments
+
+def plan_scenario(data, train_assessments, base_plan, overrides, current_date, w_mileage, w_branding,
+                  solver_config=None, profiler=None):
+    """
+    Re-plans with what-if overrides applied on top of `base_plan` (a
+    build_plan output for the same weights), hinted with the base plan.
+    The output adds "diff": the trains whose status or stabling location
+    changed. Raises ValueError on a bad override.
+    """
+    with profile_stage(profiler, "assessment"):
+        scenario_data, scenario_assessments = assess_scenario(data, train_assessments, overrides, current_date)
+    
+    base = {row["Train ID"]: row for row in base_plan["assignments"]}
+    output = build_plan(
+        scenario_data, scenario_assessments, w_mileage, w_branding, solver_config, profiler=profiler,
+        hint={train_id: row["Assigned Status"] for train_id, row in base.items()},
+        previous_stabling={train_id: row.get("Stabling Location") for train_id, row in base.items()}
+    )
+    if "error" in output:
+        return output
+    
+    output["diff"] = [
+        {
+            "Train ID": row["Train ID"],
+            "Base Status": base[row["Train ID"]]["Assigned Status"],
+            "Scenario Status": row["Assigned Status"],
+            "Base Stabling": base[row["Train ID"]].get("Stabling Location"),
+            "Scenario Stabling": row.get("Stabling Location"),
+        }
+        for row in output["assignments"]
+        if row["Assigned Status"] != base[row["Train ID"]]["Assigned Status"]
+        or row.get("Stabling Location") != base[row["Train ID"]].get("Stabling Location")
+    ]
+    output["base_metrics"] = base_plan["metrics"]
+    return output
+
+# Base run shared with batch workers; set by the pool initializer
+_batch_base = None
+
+def _init_batch_worker(base):
+    global _batch_base
+    _batch_base = base
+
+def _evaluate_scenario(scenario):
+    """
+    Assesses and solves one batch scenario against the shared base run.
+    A scenario that fails is reported as an Error result, so the rest of
+    the batch still runs.
+    """
+    data, train_assessments, base_solution, current_date, w_mileage, w_branding, solver_config = _batch_base
+    result = {"name": scenario["name"]}
+    try:
+        scenario_data, scenario_assessments = assess_scenario(
+            data, train_assessments, scenario["overrides"], current_date
+        )
+    except ValueError as e:
+        return {**result, "status": "Error", "error": f"Invalid override: {e}"}
+    except Exception as e:
+        return {**result, "status": "Error", "error": f"Scenario failed: {e!r}"}
+    
+    available = sum(1 for assessment in scenario_assessments.values() if assessment.is_eligible)
+    try:
+        solution = optimize_train_assignment(
+            scenario_data, scenario_assessments, w_mileage, w_branding, solver_config, hint=base_solution
+        )
+    except Exception as e:
+        return {**result, "status": "Error", "error": f"Solver failed: {e}"}
+    if "error" in solution:
+        return {
+            **result, "status": "Shortfall", "available_trains": available,
+            "shortfall": max(0, REQUIRED_REVENUE - available), "revenue_trains": []
+        }
+    revenue = sorted(tid for tid, status in solution.items() if status == "Revenue Service")
+    return {
+        **result, "status": "Success", "available_trains": available,
+        "shortfall": max(0, REQUIRED_REVENUE - len(revenue)), "revenue_trains": revenue
+    }
+
+def run_batch(data, train_assessments, scenarios, current_date, w_mileage, w_branding, solver_config=None,
+              jobs=None):
+    """
+    Evaluates many what-if scenarios in a process pool. Each scenario is
+    {"name": ..., "overrides": [...]}. The base tables and assessments are
+    handed to the workers once, through fork where the platform has it, and
+    every scenario is hinted with the base plan. CP-SAT runs one search
+    worker per scenario unless `workers` is set explicitly.
+
+    Returns per-scenario results and aggregates: the share of planned
+    scenarios in which each train is in Revenue Service, and how often
+    fewer than REQUIRED_REVENUE trains could be put in service.
+    """
+    # Only batch runs need a process pool; keep them out of start-up
+    import concurrent.futures
+    import multiprocessing
+    
+    # Parallelism comes from the pool, so each search gets one worker by default
+    solver_config = parse_solver_config(solver_config)
+    solver_config["workers"] = solver_config["workers"] or 1
+    base_solution = optimize_train_assignment(data, train_assessments, w_mileage, w_branding, solver_config)
+    if "error" in base_solution:
+        return base_solution
+    
+    base = (data, train_assessments, base_solution, current_date, w_mileage, w_branding, solver_config)
+    jobs = jobs or os.cpu_count() or 1
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, mp_context=context, initializer=_init_batch_worker, initargs=(base,)
+    ) as pool:
+        chunksize = max(1, len(scenarios) // (8 * jobs))
+        results = list(pool.map(_evaluate_scenario, scenarios, chunksize=chunksize))
+    
+    evaluated = [result for result in results if result["status"] != "Error"]
+    planned = [result for result in evaluated if result["status"] == "Success"]
+    revenue_counts = dict.fromkeys(train_assessments, 0)
+    for result in planned:
+        for train_id in result["revenue_trains"]:
+            revenue_counts[train_id] += 1
+    
+    shortfalls = [result["shortfall"] for result in evaluated]
+    return {
+        "status": "Success",
+        "scenarios": len(scenarios),
+        "evaluated": len(evaluated),
+        "planned": len(planned),
+        "errors": len(results) - len(evaluated),
+        "shortfall_frequency": round(sum(1 for s in shortfalls if s) / len(evaluated), 4) if evaluated else 0,
+        "mean_shortfall": round(float(np.mean(shortfalls)), 2) if evaluated else 0,
+        "revenue_probability": {
+            train_id: round(count / len(planned), 4)
+            for train_id, count in sorted(revenue_counts.items(), key=lambda item: (-item[1], item[0]))
+        } if planned else {},
+        "results": [
+            {key: value for key, value in result.items() if key != "revenue_trains"} for result in results
+        ]
+    }
+
+def parse_scenarios(spec):
+    """
+    Normalizes a scenario file: a list of {"name", "overrides"} objects or
+    of bare override lists, optionally wrapped in {"scenarios": [...]}.
+    Raises ValueError on anything else.
+    """
+    if isinstance(spec, dict):
+        spec = spec.get("scenarios")
+    if not isinstance(spec, list):
+        raise ValueError("expected a list of scenarios")
+    scenarios = []
+    for i, scenario in enumerate(spec):
+        if isinstance(scenario, list):
+            scenario = {"overrides": scenario}
+        if not isinstance(scenario, dict) or not isinstance(scenario.get("overrides"), list):
+            raise ValueError(f"scenario {i} needs a list of overrides")
+        scenarios.append({"name": scenario.get("name", f"scenario_{i + 1}"), "overrides": scenario["overrides"]})
+    return scenarios
+
+def assessment_summary(train_assessments):
+    """
+    Fleet counts reported in the "assessment" progress event.
+    """
+    return {
+        "trains": len(train_assessments),
+        "eligible": sum(1 for assessment in train_assessments.values() if assessment.is_eligible)
+    }
+
+def _branding_urgency(current_hours, target_hours):
+    """
+    Branding urgency for the given exposure, as in assess_train_constraints.
+    """
+    if not current_hours < target_hours:
+        return 0
+    completion_ratio = current_hours / target_hours
+    if completion_ratio < 0.7:
+        return 100
+    if completion_ratio < 0.9:
+        return 70
+    return 30
+
+def _horizon_candidates(night_values, nights_available, days):
+    """
+    Trains that can run in an optimal horizon plan, in `night_values` order.
+
+    Suppose train X runs on night d. Every other train available that night
+    and idle on it must already run all of its nights worth more than X's
+    best night, or swapping it in for X on night d would improve the plan.
+    A plan has only REQUIRED_REVENUE * days revenue nights, so if those
+    nights (after setting aside the REQUIRED_REVENUE - 1 trains running
+    alongside X) cannot fit, X cannot run on night d. Trains that cannot
+    run on any of their nights are dropped.
+    """
+    train_ids = list(night_values)
+    available = np.array([nights_available[tid] for tid in train_ids])
+    # Row i holds train i's night values, -1 past its last available night
+    values = np.full((len(train_ids), days), -1, dtype=np.int64)
+    for i, tid in enumerate(train_ids):
+        values[i, :available[i]] = night_values[tid]
+    best = values[:, 0]
+    limit = REQUIRED_REVENUE * days - REQUIRED_REVENUE
+    
+    def fits(on_night, value):
+        # Whether the nights worth more than `value` fit beside a train running that night
+        counts = (values[on_night] > value).sum(axis=1)
+        alongside = np.partition(counts, len(counts) - REQUIRED_REVENUE + 1)[len(counts) - REQUIRED_REVENUE + 1:]
+        return counts.sum() - alongside.sum() <= limit
+    
+    keep = np.zeros(len(train_ids), dtype=bool)
+    candidates = np.unique(best)
+    for day in range(days):
+        on_night = available > day
+        # Lowest best-night value that still fits; fits() is monotone in the value
+        low, high = 0, len(candidates) - 1
+        while low < high:
+            mid = (low + high) // 2
+            if fits(on_night, candidates[mid]):
+                high = mid
+            else:
+                low = mid + 1
+        keep |= on_night & (best >= candidates[low])
+    return [tid for tid, kept in zip(train_ids, keep) if kept]
+
+def plan_horizon(data, train_assessments, start_date, days, w_mileage, w_branding, previous_plan=None,
+                 solver_config=None, on_solution=None, profiler=None):
+    """
+    Plans `days` consecutive nights from `start_date` in one CP-SAT model.
+
+    Each revenue night adds DAILY_REVENUE_KM of mileage and, for wrapped
+    trains, EXPOSURE_HOURS_PER_DAY of branding exposure, so the value of a
+    train's k-th revenue night falls as its mileage score and branding
+    urgency are used up. Trains drop out on the day their first certificate
+    expires; job cards are assumed to stay as they are today.
+
+    `previous_plan` is the "days" list of an earlier horizon run; nights it
+    covers are used as solution hints so re-plans start from it. Other
+    nights are hinted with a greedy plan (each night, the trains whose next
+    revenue night is worth most), which is also returned if CP-SAT finds
+    no solution in time.
+    `on_solution` receives each improving solution's revenue trains per night.
+    """
+    with profile_stage(profiler, "model_build"):
+        dates = [start_date + datetime.timedelta(days=d) for d in range(days)]
+        
+        slas = data["slas"].drop_duplicates("trainset_id", keep="first").set_index("trainset_id")
+        
+        # Mileage score lost per revenue night, with the fleet normalization fixed at day 0
+        std_mileage = np.std(data["trainsets"]["cumulative_mileage_km"].to_numpy())
+        score_drop = 20 * DAILY_REVENUE_KM / std_mileage if std_mileage > 0 else 0
+        
+        candidate_trains = [
+            tid for tid, assessment in train_assessments.items()
+            if assessment.is_eligible and assessment.pending_work_hours <= 15
+        ]
+        
+        # Each candidate is available from the first night until its first
+        # certificate expires. The k-th revenue night of a train is worth
+        # night_values[train_id][k]; values never increase with k.
+        nights_available = {}
+        night_values = {}
+        day_trains = [[] for _ in dates]
+        for train_id in candidate_trains:
+            assessment = train_assessments[train_id]
+            expiry = assessment.next_cert_expiry
+            nights = sum(1 for date in dates if expiry is None or expiry >= date)
+            if not nights:
+                continue
+            sla = slas.loc[train_id] if train_id in slas.index else None
+            values = []
+            for k in range(nights):
+                value = int(max(0, assessment.mileage_score - score_drop * k) * w_mileage)
+                if assessment.has_branding_wrap and sla is not None:
+                    exposure = sla["current_exposure_hours"] + k * EXPOSURE_HOURS_PER_DAY
+                    value += int(_branding_urgency(exposure, sla["target_exposure_hours"]) * w_branding)
+                values.append(value)
+            nights_available[train_id] = nights
+            night_values[train_id] = values
+            for day in range(nights):
+                day_trains[day].append(train_id)
+        
+        # Exactly REQUIRED_REVENUE trains in revenue service every night
+        for day, date in enumerate(dates):
+            if len(day_trains[day]) < REQUIRED_REVENUE:
+                return {
+                    "error": f"Insufficient eligible trains on {date}: {len(day_trains[day])} available, {REQUIRED_REVENUE} required"
+                }
+        
+        # Only trains whose best night can rank among the REQUIRED_REVENUE * days
+        # nights a plan runs go in the model; the rest stay on standby
+        model_trains = _horizon_candidates(night_values, nights_available, days)
+        kept = set(model_trains)
+        day_trains = [[tid for tid in trains_today if tid in kept] for trains_today in day_trains]
+        
+        model = cp_model.CpModel()
+        revenue_vars = {}
+        for day, trains_today in enumerate(day_trains):
+            day_vars = []
+            for train_id in trains_today:
+                revenue_vars[train_id, day] = model.NewBoolVar(f'revenue_{train_id}_{day}')
+                day_vars.append(revenue_vars[train_id, day])
+            model.Add(sum(day_vars) == REQUIRED_REVENUE)
+        
+        # OBJECTIVE: the solver fills a train's night steps in order, so the
+        # objective stays linear
+        step_vars, step_values = [], []
+        train_steps = {}
+        for train_id in model_trains:
+            nights = [revenue_vars[train_id, day] for day in range(nights_available[train_id])]
+            steps = [model.NewBoolVar(f'night_{train_id}_{k}') for k in range(len(nights))]
+            model.Add(sum(steps) == sum(nights))
+            step_vars.extend(steps)
+            step_values.extend(night_values[train_id])
+            train_steps[train_id] = (steps, night_values[train_id])
+        
+        model.Maximize(cp_model.LinearExpr.WeightedSum(step_vars, step_values))
+    
+    # Greedy plan: night by night, the trains whose next revenue night is worth most
+    greedy = set()
+    greedy_objective = 0
+    nights_used = dict.fromkeys(train_steps, 0)
+    for day, trains_today in enumerate(day_trains):
+        next_values = np.array([train_steps[tid][1][nights_used[tid]] for tid in trains_today], dtype=np.int64)
+        for i in _top_k(next_values, REQUIRED_REVENUE):
+            train_id = trains_today[i]
+            greedy.add((train_id, day))
+            greedy_objective += int(next_values[i])
+            nights_used[train_id] += 1
+    
+    # Warm start from the nights an earlier plan already covered, and the greedy plan elsewhere
+    previous_revenue = {}
+    if previous_plan:
+        previous_revenue = {night["date"]: set(night["revenue_trains"]) for night in previous_plan}
+    hinted_nights = dict.fromkeys(train_steps, 0)
+    for (train_id, day), var in revenue_vars.items():
+        planned = previous_revenue.get(dates[day].isoformat())
+        hint = train_id in planned if planned is not None else (train_id, day) in greedy
+        model.AddHint(var, hint)
+        hinted_nights[train_id] += hint
+    for train_id, (steps, _) in train_steps.items():
+        for k, step in enumerate(steps):
+            model.AddHint(step, k < hinted_nights[train_id])
+    
+    def revenue_by_night(boolean_value):
+        nights = {date.isoformat(): [] for date in dates}
+        for (train_id, day), var in revenue_vars.items():
+            if boolean_value(var):
+                nights[dates[day].isoformat()].append(train_id)
+        return nights
+    
+    solver = make_solver(solver_config)
+    callback = None
+    if on_solution is not None:
+        callback = solution_progress(on_solution, lambda cb: revenue_by_night(cb.BooleanValue))
+    if profiler is not None:
+        profiler.attach(solver)
+    with profile_stage(profiler, "search"):
+        status = solver.Solve(model, callback)
+    if profiler is not None:
+        profiler.record_solver(solver, status, "horizon")
+    solved = status == cp_model.OPTIMAL or status == cp_model.FEASIBLE
+    if solved:
+        is_revenue = lambda train_id, day: solver.BooleanValue(revenue_vars[train_id, day])
+        objective = int(solver.ObjectiveValue())
+    else:
+        is_revenue = lambda train_id, day: (train_id, day) in greedy
+        objective = greedy_objective
+    
+    nights_per_train = dict.fromkeys(train_assessments, 0)
+    night_plans = []
+    for day, date in enumerate(dates):
+        revenue, standby, maintenance = [], [], []
+        for train_id in train_assessments:
+            if day >= nights_available.get(train_id, 0):
+                maintenance.append(train_id)
+            elif (train_id, day) in revenue_vars and is_revenue(train_id, day):
+                revenue.append(train_id)
+                nights_per_train[train_id] += 1
+            else:
+                standby.append(train_id)
+        night_plans.append({
+            "date": date.isoformat(),
+            "revenue_trains": revenue,
+            "standby_trains": standby,
+            "maintenance_trains": maintenance
+        })
+    
+    trains = []
+    for train_id, nights in nights_per_train.items():
+        assessment = train_assessments[train_id]
+        exposure = None
+        if train_id in slas.index:
+            exposure = int(slas.loc[train_id, "current_exposure_hours"])
+            if assessment.has_branding_wrap:
+                exposure += nights * EXPOSURE_HOURS_PER_DAY
+        trains.append({
+            "Train ID": train_id,
+            "Revenue Nights": nights,
+            "Projected Mileage": round(assessment.mileage + nights * DAILY_REVENUE_KM),
+            "Projected Exposure Hours": exposure
+        })
+    
+    start_mileage = [t.mileage for t in train_assessments.values()]
+    end_mileage = [t["Projected Mileage"] for t in trains]
+    metrics = {
+        "horizon_days": days,
+        "objective": objective,
+        "optimal": status == cp_model.OPTIMAL,
+        "fallback": not solved,
+        "mileage_std_start": round(np.std(start_mileage)),
+        "mileage_std_end": round(np.std(end_mileage)),
+        "status": "Success"
+    }
+    if profiler is not None:
+        metrics["profile"] = profiler.report()
+    
+    return {
+        "status": "Success",
+        "days": night_plans,
+        "trains": trains,
+        "metrics": metrics
+    }
+
+class SolverService:
+    """
+    Long-running solver process. Keeps imports, loaded tables and train
+    assessments warm and answers JSON-lines requests on stdin/stdout:
+
+        {"id": 1, "w_mileage": 7, "w_branding": 60}
+        {"id": 2, "op": "sweep", "w_mileage": "1:10:1", "w_branding": [20, 60, 100]}
+        {"id": 3, "op": "horizon", "w_mileage": 7, "w_branding": 60, "days": 14}
+        {"id": 4, "w_mileage": 7, "w_branding": 60, "solver": {"workers": 8, "time_limit": 1.0}}
+        {"id": 5, "w_mileage": 7, "w_branding": 60, "stream": true, "profile": true}
+        {"id": 6, "op": "scenario", "w_mileage": 7, "w_branding": 60,
+         "overrides": [{"table": "job_cards", "where": {"job_card_id": "MAXIMO-00017"}, "set": {"status": "CLOSED"}}]}
+        {"id": 7, "op": "reload"}
+        {"id": 8, "op": "shutdown"}
+
+    Each response is one JSON line echoing the request id. Only tables (or
+    trainsets) changed since the last request are reloaded and re-assessed.
+    Horizon requests are warm-started from the previous horizon plan. Plan
+    and sweep outputs are served from `cache` (a ResultCache) when the
+    same request has already been solved against the same data.
+    `"profile": "memory"` reports per-stage memory peaks instead of times.
+    """
+    
+    def __init__(self, db_path, current_date, solver_config=None, profile=False, cache=None):
+        self.current_date = current_date
+        self.solver_config = solver_config or DEFAULT_SOLVER_CONFIG
+        self.profile = profile
+        self.cache = cache
+        self.tables = TableCache(db_path)
+        self.data = None
+        self.data_digest = None
+        self.train_assessments = None
+        self.last_horizon = None
+    
+    def refresh(self, force=False):
+        """
+        Reloads changed data and re-assesses the trains it affects.
+        """
+        if force:
+            self.tables.invalidate()
+        changes = self.tables.refresh()
+        if not changes:
+            return
+        self.data = self.tables.data
+        self.data_digest = data_digest(self.data) if self.cache is not None else None
+        
+        # Mileage normalization depends on the whole trainsets table
+        if self.train_assessments is None or "trainsets" in changes or any(
+            changes.get(name, ()) is None for name in TRAIN_KEYED_TABLES
+        ):
+            self.train_assessments = assess_train_constraints(self.data, self.current_date)
+            return
+        
+        changed_trains = set().union(*(changes.get(name, ()) for name in TRAIN_KEYED_TABLES))
+        if changed_trains:
+            self.train_assessments.update(
+                assess_train_constraints(self.data, self.current_date, train_ids=changed_trains)
+            )
+    
+    def handle(self, request, emit=None):
+        """
+        Answers a single decoded request with a JSON-ready dict. If `emit` is
+        given, progress events (assessment, each improved solution) are
+        passed to it before the result is returned.
+        """
+        op = request.get("op", "plan")
+        if op == "ping":
+            return {"status": "ok"}
+        if op == "reload":
+            self.refresh(force=True)
+            return {"status": "ok"}
+        if op not in ("plan", "sweep", "horizon", "scenario"):
+            return {"error": f"Unknown op: {op}"}
+        
+        try:
+            if op == "sweep":
+                weight_pairs = weight_grid(request["w_mileage"], request["w_branding"])
+            else:
+                w_mileage = int(request["w_mileage"])
+                w_branding = int(request["w_branding"])
+        except (KeyError, TypeError, ValueError):
+            return {"error": "Weights for mileage and branding must be integers."}
+        
+        try:
+            solver_config = parse_solver_config({**self.solver_config, **request.get("solver", {})})
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid solver options: {e}"}
+        
+        if op == "horizon":
+            try:
+                days = int(request["days"])
+                start_date = self.current_date
+                if request.get("start_date"):
+                    start_date = datetime.date.fromisoformat(request["start_date"])
+            except (KeyError, TypeError, ValueError):
+                return {"error": "Horizon requires an integer number of days and an optional ISO start_date."}
+            if not 1 <= days <= MAX_HORIZON_DAYS:
+                return {"error": f"Horizon must be between 1 and {MAX_HORIZON_DAYS} days."}
+        
+        if op == "scenario" and not isinstance(request.get("overrides"), list):
+            return {"error": "Scenario requires a list of overrides."}
+        
+        profile = request.get("profile", self.profile)
+        profiler = Profiler(memory=profile == "memory") if profile else None
+        # Requests can return early (errors, cache hits); tracing must not outlive them
+        try:
+            try:
+                with profile_stage(profiler, "refresh"):
+                    self.refresh()
+            except Exception as e:
+                return {"error": f"Database loading failed: {e}"}
+            
+            on_solution = None
+            if emit is not None:
+                emit({"event": "assessment", **assessment_summary(self.train_assessments)})
+                on_solution = lambda event: emit({"event": "solution", **event})
+            
+            if op == "sweep":
+                return self._cached(
+                    "sweep", [weight_pairs, self.current_date, solver_config], profiler,
+                    lambda: sweep_weights(self.train_assessments, weight_pairs, solver_config, profiler)
+                )
+            if op == "horizon":
+                train_assessments = self.train_assessments
+                if start_date != self.current_date:
+                    with profile_stage(profiler, "assessment"):
+                        train_assessments = assess_train_constraints(self.data, start_date)
+                output = plan_horizon(
+                    self.data, train_assessments, start_date, days, w_mileage, w_branding,
+                    previous_plan=self.last_horizon, solver_config=solver_config, on_solution=on_solution,
+                    profiler=profiler
+                )
+                if "error" not in output:
+                    self.last_horizon = output["days"]
+                return output
+            
+            # Scenarios are diffed against the plan for the same weights
+            base_plan = self._cached(
+                "plan", [[w_mileage, w_branding], self.current_date, solver_config], profiler,
+                lambda: build_plan(
+                    self.data, self.train_assessments, w_mileage, w_branding, solver_config,
+                    on_solution if op == "plan" else None, profiler
+                )
+            )
+            if op == "plan" or "error" in base_plan:
+                return base_plan
+            try:
+                return plan_scenario(
+                    self.data, self.train_assessments, base_plan, request["overrides"], self.current_date,
+                    w_mileage, w_branding, solver_config, profiler
+                )
+            except ValueError as e:
+                return {"error": f"Invalid override: {e}"}
+        finally:
+            if profiler is not None:
+                profiler.close()
+    
+    def _cached(self, op, params, profiler, compute):
+        """
+        Returns the cached output for (op, params) against the current data,
+        or computes and stores it. Profiled requests always compute, so
+        their timings are real.
+        """
+        if self.cache is None or profiler is not None:
+            return compute()
+        key = cache_key(self.data_digest, op, params)
+        output = self.cache.get(key)
+        if output is not None:
+            return {**output, "cached": True}
+        output = compute()
+        if "error" not in output:
+            self.cache.put(key, output)
+        return output
+    
+    def serve(self, stdin=sys.stdin, stdout=sys.stdout):
+        """
+        Reads one JSON request per line until EOF or a shutdown op. Requests
+        with "stream": true get progress event lines before the result line,
+        which is then tagged "event": "result".
+        """
+        def write(message):
+            stdout.write(json.dumps(message) + "\n")
+            stdout.flush()
+        
+        for line in stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                response, request = {"error": f"Invalid request: {e}"}, {}
+            else:
+                if not isinstance(request, dict):
+                    write({"error": "Invalid request: expected an object", "id": None})
+                    continue
+                if request.get("op") == "shutdown":
+                    break
+                emit = None
+                if request.get("stream"):
+                    emit = lambda event, request_id=request.get("id"): write({**event, "id": request_id})
+                try:
+                    response = self.handle(request, emit)
+                except Exception as e:
+                    response = {"error": f"Solver failed: {e}"}
+                if emit is not None:
+                    response["event"] = "result"
+            response["id"] = request.get("id")
+            write(response)
+
+class _JsonArgumentParser(argparse.ArgumentParser):
+    """
+    Reports argument errors as a JSON error object, like the rest of the CLI.
+    """
+    
+    def error(self, message):
+        print(json.dumps({"error": message}))
+        sys.exit(1)
+
+def parse_flags(argv):
+    """
+    Splits flags from the positional mode arguments. Returns the solver
+    config (--workers, --time-limit, --relative-gap, --deterministic,
+    --fast-first, --instant), the output flags (--stream, --profile,
+    --profile-memory, --cprofile, --cache, --no-cache, --jobs) and the
+    remaining arguments. SOLVER_PROFILE=1, SOLVER_PROFILE=memory and
+    SOLVER_CPROFILE=<path> in the environment act like --profile,
+    --profile-memory and --cprofile. `profile` is then True, "memory" or False.
+    """
+    parser = _JsonArgumentParser(add_help=False)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--profile-memory", dest="profile_memory", action="store_true")
+    parser.add_argument("--cprofile", metavar="PATH")
+    parser.add_argument("--cache", metavar="PATH")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true")
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--time-limit", dest="time_limit", type=float)
+    parser.add_argument("--relative-gap", dest="relative_gap", type=float)
+    parser.add_argument("--deterministic", action="store_true", default=None)
+    parser.add_argument("--fast-first", dest="fast_first", action="store_true", default=None)
+    parser.add_argument("--instant", action="store_true", default=None)
+    flags, rest = parser.parse_known_args(argv)
+    output_flags = argparse.Namespace(
+        stream=flags.stream,
+        profile=(
+            "memory" if flags.profile_memory or os.environ.get("SOLVER_PROFILE") == "memory"
+            else flags.profile or os.environ.get("SOLVER_PROFILE") == "1"
+        ),
+        cprofile=flags.cprofile or os.environ.get("SOLVER_CPROFILE"),
+        cache=flags.cache,
+        no_cache=flags.no_cache,
+        jobs=flags.jobs
+    )
+    
+    solver_options = {
+        k: v for k, v in vars(flags).items() if v is not None and k in DEFAULT_SOLVER_CONFIG
+    }
+    try:
+        solver_config = parse_solver_config(solver_options)
+    except ValueError as e:
+        parser.error(str(e))
+    return solver_config, output_flags, rest
+
+def print_event(event, file=sys.stdout):
+    """
+    Writes a progress event as one JSON line.
+    """
+    print(json.dumps(event), file=file, flush=True)
+
+def print_result(output, stream):
+    """
+    Prints the final output: pretty JSON, or a "result" event line when streaming.
+    """
+    if stream:
+        print_event({"event": "result", **output})
+    else:
+        print(json.dumps(output, indent=4))
+
+def lookup_result_cache(flags, db_path, op, params):
+    """
+    Opens the result cache for this run (--cache PATH, or a file next to
+    the database) and looks the request up by table digest, before any
+    data is loaded. Returns (cache, key, cached output or None); the cache
+    is None with --no-cache or --profile, or if the database cannot be
+    hashed, in which case loading reports the problem.
+    """
+    if flags.no_cache or flags.profile or not os.path.exists(db_path):
+        return None, None, None
+    try:
+        key = cache_key(table_digest(db_path), op, params)
+    except sqlite3.Error:
+        return None, None, None
+    cache = ResultCache(flags.cache or default_cache_path(db_path))
+    return cache, key, cache.get(key)
+
+def main():
+    """
+    Main execution function with enhanced 6-factor optimization.
+    """
+    solver_config, flags, args = parse_flags(sys.argv[1:])
+    if not flags.cprofile:
+        run(solver_config, flags, args)
+        return
+    
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        run(solver_config, flags, args)
+    finally:
+        profile.disable()
+        profile.dump_stats(flags.cprofile)
+
+def run(solver_config, flags, args):
+    """
+    Dispatches to the mode selected by the positional arguments.
+    """
+    current_date = PLANNING_DATE
+    stream = flags.stream
+    
+    # With --stream, stdout carries newline-delimited progress events followed
+    # by a "result" event; --fast-first alone reports solutions on stderr.
+    on_solution = None
+    if stream:
+        on_solution = lambda event: print_event({"event": "solution", **event})
+    elif solver_config["fast_first"]:
+        on_solution = lambda event: print_event({"event": "solution", **event}, file=sys.stderr)
+    
+    if len(args) == 2 and args[0] == "--serve":
+        cache = None if flags.no_cache else ResultCache(flags.cache or default_cache_path(args[1]))
+        SolverService(args[1], current_date, solver_config, flags.profile, cache).serve()
+        return
+    
+    profiler = Profiler(memory=flags.profile == "memory") if flags.profile else None
+    try:
+        run_once(solver_config, flags, args, profiler, on_solution)
+    finally:
+        if profiler is not None:
+            profiler.close()
+
+def run_once(solver_config, flags, args, profiler, on_solution):
+    """
+    Runs one planning mode (sweep, horizon, scenario, batch or a single plan)
+    and prints its output.
+    """
+    current_date = PLANNING_DATE
+    stream = flags.stream
+    
+    if len(args) == 4 and args[0] == "--sweep":
+        try:
+            weight_pairs = weight_grid(args[2], args[3])
+        except ValueError:
+            print(json.dumps({"error": "Weight grids must be integer lists (1,5,10) or ranges (start:stop:step)."}))
+            sys.exit(1)
+        cache, key, output = lookup_result_cache(flags, args[1], "sweep", [weight_pairs, current_date, solver_config])
+        if output is not None:
+            print_result({**output, "cached": True}, stream)
+            return
+        with profile_stage(profiler, "load"):
+            data = load_data_from_db(args[1])
+        with profile_stage(profiler, "assessment"):
+            train_assessments = assess_train_constraints(data, current_date)
+        if stream:
+            print_event({"event": "assessment", **assessment_summary(train_assessments)})
+        output = sweep_weights(train_assessments, weight_pairs, solver_config, profiler)
+        if cache is not None and "error" not in output:
+            cache.put(key, output)
+        print_result(output, stream)
+        sys.exit(1 if "error" in output else 0)
+    
+    if len(args) in (5, 6) and args[0] == "--horizon":
+        try:
+            w_mileage = int(args[2])
+            w_branding = int(args[3])
+            days = int(args[4])
+        except ValueError:
+            print(json.dumps({"error": "Weights and horizon days must be integers."}))
+            sys.exit(1)
+        if not 1 <= days <= MAX_HORIZON_DAYS:
+            print(json.dumps({"error": f"Horizon must be between 1 and {MAX_HORIZON_DAYS} days."}))
+            sys.exit(1)
+        previous_plan = None
+        if len(args) == 6:
+            try:
+                with open(args[5]) as f:
+                    previous_plan = json.load(f)
+                previous_plan = previous_plan.get("days") if isinstance(previous_plan, dict) else None
+                if not isinstance(previous_plan, list) or not all(
+                    isinstance(night, dict) and "date" in night and "revenue_trains" in night for night in previous_plan
+                ):
+                    raise ValueError("expected the output of an earlier --horizon run")
+            except (OSError, ValueError) as e:
+                print(json.dumps({"error": f"Invalid previous plan file: {e}"}))
+                sys.exit(1)
+        with profile_stage(profiler, "load"):
+            data = load_data_from_db(args[1])
+        with profile_stage(profiler, "assessment"):
+            train_assessments = assess_train_constraints(data, current_date)
+        if stream:
+            print_event({"event": "assessment", **assessment_summary(train_assessments)})
+        output = plan_horizon(
+            data, train_assessments, current_date, days, w_mileage, w_branding, previous_plan,
+            solver_config, on_solution, profiler
+        )
+        print_result(output, stream)
+        sys.exit(1 if "error" in output else 0)
+    
+    if len(args) == 5 and args[0] == "--scenario":
+        try:
+            w_mileage = int(args[2])
+            w_branding = int(args[3])
+        except ValueError:
+            print(json.dumps({"error": "Weights for mileage and branding must be integers."}))
+            sys.exit(1)
+        try:
+            with open(args[4]) as f:
+                overrides = json.load(f)
+        except (OSError, ValueError) as e:
+            print(json.dumps({"error": f"Invalid scenario file: {e}"}))
+            sys.exit(1)
+        if isinstance(overrides, dict):
+            overrides = overrides.get("overrides")
+        if not isinstance(overrides, list):
+            print(json.dumps({"error": "Scenario file must hold a list of overrides."}))
+            sys.exit(1)
+        with profile_stage(profiler, "load"):
+            data = load_data_from_db(args[1])
+        with profile_stage(profiler, "assessment"):
+            train_assessments = assess_train_constraints(data, current_date)
+        base_plan = build_plan(data, train_assessments, w_mileage, w_branding, solver_config, profiler=profiler)
+        if "error" in base_plan:
+            print(json.dumps(base_plan))
+            sys.exit(1)
+        try:
+            output = plan_scenario(
+                data, train_assessments, base_plan, overrides, current_date, w_mileage, w_branding,
+                solver_config, profiler
+            )
+        except ValueError as e:
+            output = {"error": f"Invalid override: {e}"}
+        print_result(output, stream)
+        sys.exit(1 if "error" in output else 0)
+    
+    if len(args) == 5 and args[0] == "--batch":
+        try:
+            w_mileage = int(args[2])
+            w_branding = int(args[3])
+        except ValueError:
+            print(json.dumps({"error": "Weights for mileage and branding must be integers."}))
+            sys.exit(1)
+        try:
+            with open(args[4]) as f:
+                scenarios = parse_scenarios(json.load(f))
+        except (OSError, ValueError) as e:
+            print(json.dumps({"error": f"Invalid scenario file: {e}"}))
+            sys.exit(1)
+        data = load_data_from_db(args[1])
+        train_assessments = assess_train_constraints(data, current_date)
+        output = run_batch(
+            data, train_assessments, scenarios, current_date, w_mileage, w_branding, solver_config, flags.jobs
+        )
+        print_result(output, stream)
+        sys.exit(1 if "error" in output else 0)
+    
+    if len(args) != 3:
+        print(json.dumps({"error": "Usage: python solver2.py <db_path> <w_mileage> <w_branding> | --serve <db_path> | --sweep <db_path> <w_mileage_grid> <w_branding_grid> | --horizon <db_path> <w_mileage> <w_branding> <days> [previous_plan.json] | --scenario <db_path> <w_mileage> <w_branding> <overrides.json> | --batch <db_path> <w_mileage> <w_branding> <scenarios.json> [--jobs N] [--stream] [--profile] [--profile-memory] [--cprofile PATH] [--cache PATH] [--no-cache] [--workers N] [--time-limit S] [--relative-gap G] [--deterministic] [--fast-first] [--instant]"}))
+        sys.exit(1)
+    
+    db_path = args[0]
+    try:
+        w_mileage = int(args[1])
+        w_branding = int(args[2])
+    except ValueError:
+        print(json.dumps({"error": "Weights for mileage and branding must be integers."}))
+        sys.exit(1)
+    
+    # Identical data and parameters give the cached plan without loading or solving
+    cache, key, output = lookup_result_cache(
+        flags, db_path, "plan", [[w_mileage, w_branding], current_date, solver_config]
+    )
+    if output is not None:
+        print_result({**output, "cached": True}, stream)
+        return
+    
+    # Load and analyze data
+    with profile_stage(profiler, "load"):
+        data = load_data_from_db(db_path)
+    with profile_stage(profiler, "assessment"):
+        train_assessments = assess_train_constraints(data, current_date)
+    if stream:
+        print_event({"event": "assessment", **assessment_summary(train_assessments)})
+    
+    output = build_plan(data, train_assessments, w_mileage, w_branding, solver_config, on_solution, profiler)
+    if "error" in output:
+        print(json.dumps({"event": "result", **output}) if stream else json.dumps(output))
+        sys.exit(1)
+    if cache is not None:
+        cache.put(key, output)
     
-    print(json.dumps(output, indent=4))
+    print_result(output, stream)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -626,6 +626,8 @@ document.addEventListener('DOMContentLoaded', () => {
                         <p>Mileage: ${train['Cumulative Mileage']} km (${train['Mileage vs Avg (%)']}% vs avg)</p>
                         <p>Eligibility: ${train['Is Eligible'] ? 'Yes' : 'No'} (${train['Eligibility Reason']})</p>
                         <p>Pending Work: ${train['Pending Work Hours']} hrs | Next Cert: ${train['Next Cert Expiry']}</p>
+                        ${train['Assigned Line'] ? `<p>Line: ${train['Assigned Line']}</p>` : ''}
+                        ${train['Stabling Location'] ? `<p>Stabling: ${train['Stabling Location']}</p>` : ''}
                     </div>
                 `;
                 if (train['Assigned Status'] === 'Revenue Service') {
@@ -709,34 +711,43 @@ document.addEventListener('DOMContentLoaded', () => {
         }
         fetchAndDisplayTrainOverview();
         
-        runModelForm.addEventListener('submit', async (e) => {
+        runModelForm.addEventListener('submit', (e) => {
             e.preventDefault();
             runModelBtn.textContent = 'Running...';
             runModelBtn.disabled = true;
             const w_mileage = document.getElementById('w_mileage').value;
             const w_branding = document.getElementById('w_branding').value;
-            try {
-                const response = await fetch('/api/admin/run-model', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ w_mileage, w_branding }),
-                });
-                const result = await response.json();
-                if (result.error) {
-                    throw new Error(result.details || result.error);
-                }
+
+            // The solver streams its progress; show each improved plan's objective
+            // on the button and render the final result when it arrives.
+            const params = new URLSearchParams({ w_mileage, w_branding });
+            const source = new EventSource(`/api/admin/run-model/stream?${params}`);
+            const finish = () => {
+                source.close();
+                runModelBtn.textContent = 'Run Model';
+                runModelBtn.disabled = false;
+            };
+
+            source.addEventListener('solution', (event) => {
+                const { objective, bound } = JSON.parse(event.data);
+                runModelBtn.textContent = `Improving... (${objective} / ${bound})`;
+            });
+            source.addEventListener('result', (event) => {
+                const result = JSON.parse(event.data);
                 displayResults(result.assignments);
                 // **FIX**: Show the results section after a successful run
                 if (resultsWrapper) {
                     resultsWrapper.classList.remove('hidden');
                 }
-            } catch (error) {
-                console.error('Run model error:', error);
-                alert('An error occurred while running the model: ' + error.message);
-            } finally {
-                runModelBtn.textContent = 'Run Model';
-                runModelBtn.disabled = false;
-            }
+                finish();
+            });
+            source.addEventListener('error', (event) => {
+                // Server-sent error events carry details; connection failures do not
+                const result = event.data ? JSON.parse(event.data) : { error: 'Lost connection to the model stream.' };
+                console.error('Run model error:', result);
+                alert('An error occurred while running the model: ' + (result.details || result.error));
+                finish();
+            });
         });
 
         fetchDataBtn.addEventListener('click', async () => {
@@ -1,6 +1,5 @@
 const db = require('../database');
-const { spawn } = require('child_process');
-const path = require('path');
+const solverService = require('../solverService');
 
 /**
  * Helper function to query all tables from the database.
@@ -41,60 +40,141 @@ const getAllData = async (req, res) => {
     }
 };
 
+/**
+ * Sends a request to the persistent Python solver service and relays the
+ * result, reporting solver errors as a 500 with `failureMessage`.
+ * An optional `solver` object (workers, time_limit, relative_gap,
+ * deterministic, fast_first) overrides the service's CP-SAT settings.
+ */
+const forwardToSolver = async (payload, failureMessage, res) => {
+    try {
+        const result = await solverService.request(payload);
+        if (result.error) {
+            console.error(`${failureMessage} ${result.error}`);
+            return res.status(500).json({ error: failureMessage, details: result.error });
+        }
+        delete result.id;
+        res.status(200).json(result);
+    } catch (error) {
+        console.error("Error communicating with the solver service:", error);
+        res.status(500).json({ error: failureMessage, details: error.message });
+    }
+};
+
 /**
  * Controller for the "Run Model" button.
- * Executes the Python script, passing the database path directly.
+ * Sends the weights to the persistent Python solver service.
  */
 const runModel = async (req, res) => {
-    const { w_mileage, w_branding } = req.body;
+    const { w_mileage, w_branding, solver } = req.body;
     if (!w_mileage || !w_branding) {
         return res.status(400).json({ error: "Mileage and Branding weights are required." });
     }
 
-    // Define the path to the database file and the Python script
-    const dbPath = path.join(__dirname, '..', '..', 'kochi-metro.db');
-    const scriptPath = path.join(__dirname, '..', '..', 'model', 'solver2.py');
+    await forwardToSolver({ w_mileage, w_branding, solver }, 'Model execution failed.', res);
+};
 
-    try {
-        // Execute the Python script, passing the DB path and weights as arguments
-        const pythonProcess = spawn('python', [
-            scriptPath,
-            dbPath,
-            w_mileage,
-            w_branding
-        ]);
+// Solver options accepted as query parameters by the streaming endpoint
+const NUMERIC_SOLVER_OPTIONS = ['workers', 'time_limit', 'relative_gap'];
+const BOOLEAN_SOLVER_OPTIONS = ['deterministic', 'fast_first', 'instant'];
 
-        let resultData = '';
-        let errorData = '';
+/**
+ * Builds a "solver" options object from query parameters, e.g.
+ * ?workers=8&time_limit=1&deterministic=true. Returns undefined if none are set.
+ */
+const solverOptionsFromQuery = (query) => {
+    const solver = {};
+    NUMERIC_SOLVER_OPTIONS.forEach((option) => {
+        if (query[option] !== undefined) {
+            solver[option] = Number(query[option]);
+        }
+    });
+    BOOLEAN_SOLVER_OPTIONS.forEach((option) => {
+        if (query[option] !== undefined) {
+            solver[option] = query[option] === 'true' || query[option] === '1';
+        }
+    });
+    return Object.keys(solver).length ? solver : undefined;
+};
 
-        pythonProcess.stdout.on('data', (data) => {
-            resultData += data.toString();
-        });
+/**
+ * Server-Sent Events variant of the "Run Model" button. Forwards the
+ * solver's progress events (assessment, each improved plan) as they
+ * arrive and finishes with a "result" or "error" event.
+ */
+const runModelStream = async (req, res) => {
+    const { w_mileage, w_branding } = req.query;
+    const solver = solverOptionsFromQuery(req.query);
+    if (!w_mileage || !w_branding) {
+        return res.status(400).json({ error: "Mileage and Branding weights are required." });
+    }
 
-        pythonProcess.stderr.on('data', (data) => {
-            errorData += data.toString();
-        });
+    res.writeHead(200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive'
+    });
+    const send = (event, data) => {
+        res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+    };
 
-        pythonProcess.on('close', (code) => {
-            if (code !== 0) {
-                console.error(`Python script exited with code ${code}: ${errorData}`);
-                return res.status(500).json({ error: 'Model execution failed.', details: errorData });
-            }
-            
-            try {
-                // Parse the JSON output from the script and send it to the frontend
-                const finalResult = JSON.parse(resultData);
-                res.status(200).json(finalResult);
-            } catch (e) {
-                console.error('Failed to parse model output:', resultData);
-                res.status(500).json({ error: 'Failed to parse model output.', details: resultData });
-            }
+    try {
+        const result = await solverService.request({ w_mileage, w_branding, solver }, (progress) => {
+            const { event, id, ...data } = progress;
+            send(event, data);
         });
-
+        const { event, id, ...data } = result;
+        if (data.error) {
+            console.error(`Model execution failed: ${data.error}`);
+            send('error', { error: 'Model execution failed.', details: data.error });
+        } else {
+            send('result', data);
+        }
     } catch (error) {
-        console.error("Error spawning the Python process:", error);
-        res.status(500).json({ error: 'An error occurred before the model could run.' });
+        console.error("Error communicating with the solver service:", error);
+        send('error', { error: 'Model execution failed.', details: error.message });
+    }
+    res.end();
+};
+
+/**
+ * Controller for weight sweeps (mileage vs branding trade-off charts).
+ * Each weight is a list of integers or a "start:stop:step" range.
+ */
+const runSweep = async (req, res) => {
+    const { w_mileage, w_branding, solver } = req.body;
+    if (!w_mileage || !w_branding) {
+        return res.status(400).json({ error: "Mileage and Branding weight grids are required." });
+    }
+
+    await forwardToSolver({ op: 'sweep', w_mileage, w_branding, solver }, 'Weight sweep failed.', res);
+};
+
+/**
+ * Controller for multi-night horizon plans.
+ * Consecutive requests are warm-started from the previous horizon plan.
+ */
+const runHorizon = async (req, res) => {
+    const { w_mileage, w_branding, days, start_date, solver } = req.body;
+    if (!w_mileage || !w_branding || !days) {
+        return res.status(400).json({ error: "Mileage and Branding weights and horizon days are required." });
     }
+
+    await forwardToSolver({ op: 'horizon', w_mileage, w_branding, days, start_date, solver }, 'Horizon planning failed.', res);
+};
+
+/**
+ * Controller for what-if scenarios.
+ * Re-plans with the given overrides applied to a copy of the data, without
+ * touching the database, and returns the plan with its diff from the base plan.
+ */
+const runScenario = async (req, res) => {
+    const { w_mileage, w_branding, overrides, solver } = req.body;
+    if (!w_mileage || !w_branding || !Array.isArray(overrides)) {
+        return res.status(400).json({ error: "Mileage and Branding weights and a list of overrides are required." });
+    }
+
+    await forwardToSolver({ op: 'scenario', w_mileage, w_branding, overrides, solver }, 'Scenario evaluation failed.', res);
 };
 
 const getTrainOverview = async (req, res) => {
@@ -126,4 +206,4 @@ const getTrainOverview = async (req, res) => {
     }
 };
 
-module.exports = { getAllData, runModel, getTrainOverview };
\ No newline at end of file
+module.exports = { getAllData, runModel, runModelStream, runSweep, runHorizon, runScenario, getTrainOverview };
\ No newline at end of file
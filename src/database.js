@@ -1,6 +1,38 @@
 const sqlite3 = require('sqlite3').verbose();
 const DB_SOURCE = "kochi-metro.db";
 
+// Tables tracked in change_log, with the column identifying the affected trainset
+const TRACKED_TABLES = {
+    trainsets: 'trainset_id',
+    fitness_certificates: 'trainset_id',
+    job_cards: 'trainset_id',
+    branding_slas: 'trainset_id',
+    depot_resources: null,
+    depot_layout_costs: null
+};
+
+/**
+ * Creates triggers that bump a per-(table, trainset) version in change_log on
+ * every write, so the solver can reload only the rows that changed.
+ */
+const createChangeLogTriggers = () => {
+    db.run(`CREATE TABLE IF NOT EXISTS change_log (
+        table_name TEXT NOT NULL, trainset_id TEXT NOT NULL DEFAULT '', version INTEGER NOT NULL DEFAULT 1,
+        PRIMARY KEY (table_name, trainset_id)
+    )`);
+    Object.entries(TRACKED_TABLES).forEach(([table, keyColumn]) => {
+        const bump = (row) => `INSERT INTO change_log (table_name, trainset_id)
+            VALUES ('${table}', ${keyColumn ? `COALESCE(${row}.${keyColumn}, '')` : "''"})
+            ON CONFLICT (table_name, trainset_id) DO UPDATE SET version = version + 1;`;
+        db.run(`CREATE TRIGGER IF NOT EXISTS ${table}_insert_log AFTER INSERT ON ${table}
+            BEGIN ${bump('NEW')} END`);
+        db.run(`CREATE TRIGGER IF NOT EXISTS ${table}_update_log AFTER UPDATE ON ${table}
+            BEGIN ${bump('OLD')} ${bump('NEW')} END`);
+        db.run(`CREATE TRIGGER IF NOT EXISTS ${table}_delete_log AFTER DELETE ON ${table}
+            BEGIN ${bump('OLD')} END`);
+    });
+};
+
 const db = new sqlite3.Database(DB_SOURCE, (err) => {
     if (err) {
         console.error(err.message);
@@ -28,6 +60,7 @@ const db = new sqlite3.Database(DB_SOURCE, (err) => {
             db.run(`CREATE TABLE IF NOT EXISTS trainsets (
                 trainset_id TEXT PRIMARY KEY, cumulative_mileage_km INTEGER, in_service_date TEXT, has_branding_wrap TEXT
             )`);
+            createChangeLogTriggers();
         });
     }
 });
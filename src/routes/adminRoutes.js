@@ -3,6 +3,10 @@ const adminController = require('../controllers/adminController');
 
 router.get('/data', adminController.getAllData);
 router.post('/run-model', adminController.runModel);
+router.get('/run-model/stream', adminController.runModelStream);
+router.post('/sweep', adminController.runSweep);
+router.post('/horizon', adminController.runHorizon);
+router.post('/scenario', adminController.runScenario);
 router.get('/train-overview', adminController.getTrainOverview);
 
 module.exports = router;
\ No newline at end of file
@@ -0,0 +1,88 @@
+const { spawn } = require('child_process');
+const path = require('path');
+const readline = require('readline');
+
+const DB_PATH = path.join(__dirname, '..', 'kochi-metro.db');
+const SCRIPT_PATH = path.join(__dirname, '..', 'model', 'solver2.py');
+
+let solverProcess = null;
+let nextRequestId = 1;
+const pendingRequests = new Map();
+
+/**
+ * Starts the long-running Python solver in service mode.
+ * It keeps its imports and loaded data warm between requests and
+ * answers one JSON line per request on stdout.
+ */
+const startSolver = () => {
+    const child = spawn('python', [SCRIPT_PATH, '--serve', DB_PATH]);
+    let errorData = '';
+
+    readline.createInterface({ input: child.stdout }).on('line', (line) => {
+        let response;
+        try {
+            response = JSON.parse(line);
+        } catch (e) {
+            console.error('Failed to parse solver output:', line);
+            return;
+        }
+        const pending = pendingRequests.get(response.id);
+        if (!pending) {
+            return;
+        }
+        // Progress events precede the final "result" line of streamed requests
+        if (response.event && response.event !== 'result') {
+            if (pending.onEvent) {
+                pending.onEvent(response);
+            }
+            return;
+        }
+        pendingRequests.delete(response.id);
+        pending.resolve(response);
+    });
+
+    child.stderr.on('data', (data) => {
+        errorData += data.toString();
+    });
+
+    const handleExit = (reason) => {
+        if (solverProcess === child) {
+            solverProcess = null;
+        }
+        for (const pending of pendingRequests.values()) {
+            pending.reject(new Error(reason));
+        }
+        pendingRequests.clear();
+    };
+
+    child.on('error', (err) => handleExit(`Solver process failed to start: ${err.message}`));
+    child.on('close', (code) => {
+        if (code !== 0) {
+            console.error(`Solver process exited with code ${code}: ${errorData}`);
+        }
+        handleExit(`Solver process exited with code ${code}. ${errorData}`);
+    });
+
+    return child;
+};
+
+/**
+ * Sends a request to the solver service, starting it on first use.
+ * Resolves with the decoded JSON response. If `onEvent` is given the
+ * request is streamed and `onEvent` receives each progress event
+ * (assessment, improved solution) before the result.
+ */
+const request = (payload, onEvent) => {
+    if (!solverProcess) {
+        solverProcess = startSolver();
+    }
+
+    return new Promise((resolve, reject) => {
+        const id = nextRequestId++;
+        pendingRequests.set(id, { resolve, reject, onEvent });
+        const message = onEvent ? { ...payload, stream: true, id } : { ...payload, id };
+        solverProcess.stdin.write(JSON.stringify(message) + '\n');
+    });
+};
+
+module.exports = { request };